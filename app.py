@@ -1,26 +1,245 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartException, MultiPartParser
+from pydantic import BaseModel, ValidationError
 import numpy as np
 import joblib
-import cv2
-from skimage import measure, filters, morphology
-# FIXED: Updated to use 'gray' spelling for newer scikit-image versions
-from skimage.feature import graycomatrix, graycoprops
-import shutil
 import os
+import csv
+import io
+import json
+import asyncio
+import threading
+from contextlib import asynccontextmanager, nullcontext
+from compiled_model import compile_voting_classifier
+from extraction_pool import ExtractionPool
+from image_archive import DiskSpoolingParser, iter_images, stream_results
+from image_header import HEADER_BYTES, ImageHeaderError, check_image, check_pixels, read_header, reduction_factor
+from result_cache import ResultCache, content_hash, file_hash
+from feature_store import FeatureStore
+from microbatch import MicroBatcher
+from metrics import Registry, MetricsMiddleware, LATENCY_BUCKETS, metric_lines, stage, stage_memory
+from feature_kernels import (LabeledRegions, WorkBuffers, box_counts, contrast_from_histogram, glcm_contrast,
+                             label_into, largest_component, otsu_threshold, region_box_dimension,
+                             region_contrast, region_perimeters, region_shapes, segment_into, summarize)
+from tiled_extraction import (IN_MEMORY_BYTES_PER_PIXEL, LEAN_BYTES_PER_PIXEL, TiledSegmentation, band_rows,
+                              needs_tiling)
 
 # ======================
 # Load model (already normalized during training)
 # ======================
 # Ensure the model path is correct relative to where you run the server
-model = joblib.load("model/voting_classifier_model.pkl")
+MODEL_PATH = "model/voting_classifier_model.pkl"
+
+# When the model and the image libraries are loaded:
+#   eager      - during startup, before the server accepts connections (default)
+#   background - in the background after startup; /ready answers 503 until done
+#   lazy       - on first use; nothing is warmed up
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager")
+
+# Set USE_COMPILED_MODEL=0 to score with the sklearn model directly
+USE_COMPILED_MODEL = os.environ.get("USE_COMPILED_MODEL", "1") != "0"
+
+model = None
+# Flat NumPy export of the voting classifier: label and probability in one pass
+compiled_model = None
+_model_lock = threading.Lock()
+
+def load_model():
+    """Load (and compile) the model once; safe to call from any thread"""
+    global model, compiled_model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                loaded = joblib.load(MODEL_PATH)
+                if USE_COMPILED_MODEL:
+                    try:
+                        compiled_model = compile_voting_classifier(loaded)
+                    except NotImplementedError:
+                        compiled_model = None
+                model = loaded
+    return model
+
+# ======================
+# Result cache
+# ======================
+# Results are keyed by content and namespaced by the model file hash and the
+# extraction settings (see result_cache below extraction_settings), so swapping
+# the model or changing a setting invalidates everything cached before.
+# Set RESULT_CACHE_MAX_BYTES=0 to disable; RESULT_CACHE_DIR adds a SQLite tier.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 24 * 3600))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")
+
+# ======================
+# Image extraction pool
+# ======================
+# Worker processes for extract_features (0 = run in a thread of the API process)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", os.cpu_count() or 1))
+# Jobs allowed to wait for a free worker before /predict-image answers 503
+IMAGE_QUEUE_SIZE = int(os.environ.get("IMAGE_QUEUE_SIZE", 2 * IMAGE_WORKERS))
+# Seconds a single extraction may take before /predict-image answers 504
+IMAGE_JOB_TIMEOUT = float(os.environ.get("IMAGE_JOB_TIMEOUT", 30))
+
+extraction_pool = None
+
+# ======================
+# Startup and readiness
+# ======================
+startup_state = {"warm": False, "error": None}
+
+async def startup(prewarm):
+    """Start the extraction pool and, with prewarm, load and warm everything"""
+    global extraction_pool
+    try:
+        if IMAGE_WORKERS > 0:
+            pool = ExtractionPool(IMAGE_WORKERS, IMAGE_QUEUE_SIZE, IMAGE_JOB_TIMEOUT,
+                                  initializer=warm_worker)
+            await pool.start(prewarm=prewarm)
+            extraction_pool = pool
+        if prewarm:
+            await run_in_threadpool(warmup)
+    except Exception as e:
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+        raise
+
+@asynccontextmanager
+async def lifespan(app):
+    global extraction_pool
+    task = None
+    if STARTUP_MODE == "background":
+        task = asyncio.create_task(startup(prewarm=True))
+    else:
+        await startup(prewarm=STARTUP_MODE != "lazy")
+    try:
+        yield
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+        if extraction_pool is not None:
+            extraction_pool.shutdown()
+            extraction_pool = None
 
 app = FastAPI(
     title="Breast Cancer Prediction API",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
+# ======================
+# Upload settings
+# ======================
+# Largest request body accepted on image upload routes (bytes)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+UPLOAD_PATHS = {"/predict-image"}
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+# Largest image (width x height) accepted for feature extraction; checked from
+# the header before decoding (0 accepts any size)
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 16384 * 16384))
+# Images above this many pixels are decoded at 1/2, 1/4 or 1/8 scale, whichever
+# is the first to fit (0 always decodes at full size). Features are then those
+# of the reduced image.
+DECODE_MAX_PIXELS = int(os.environ.get("DECODE_MAX_PIXELS", 0))
+
+class HeaderCheckingParser(MultiPartParser):
+    """
+    Multipart parser that checks the image header of each uploaded file as
+    soon as its first bytes arrive, so an unsupported format or an image
+    over MAX_IMAGE_PIXELS is rejected before the rest of the body is read
+    """
+    # Keep accepted uploads in memory: Starlette spools multipart files to a
+    # temporary file on disk once they pass 1MB by default
+    spool_max_size = MAX_UPLOAD_BYTES
+
+    def on_part_begin(self):
+        super().on_part_begin()
+        self._header = bytearray()
+        self._header_checked = False
+
+    def on_part_data(self, data, start, end):
+        super().on_part_data(data, start, end)
+        if self._current_part.file is not None and not self._header_checked:
+            self._header += data[start:min(end, start + HEADER_BYTES - len(self._header))]
+            self._check_header(complete=False)
+            # A JPEG header that runs past HEADER_BYTES is checked on the whole file later
+            self._header_checked |= len(self._header) >= HEADER_BYTES
+
+    def on_part_end(self):
+        if self._current_part.file is not None and not self._header_checked:
+            # The whole file is shorter than HEADER_BYTES
+            self._check_header(complete=True)
+        super().on_part_end()
+
+    def _check_header(self, complete):
+        try:
+            found = read_header(self._header, complete)
+            if found is not None:
+                check_pixels(*found, MAX_IMAGE_PIXELS)
+        except ImageHeaderError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        self._header_checked = found is not None
+
+# /predict-images: largest multipart body or archive (bytes), most files per
+# body, and images extracted at once per request (default: one per worker)
+MAX_ARCHIVE_BYTES = int(os.environ.get("MAX_ARCHIVE_BYTES", 1024 * 1024 * 1024))
+MAX_ARCHIVE_FILES = int(os.environ.get("MAX_ARCHIVE_FILES", 1000))
+ARCHIVE_CONCURRENCY = int(os.environ.get("ARCHIVE_CONCURRENCY", max(IMAGE_WORKERS, 1)))
+
+class MaxUploadSizeMiddleware:
+    """Reject upload bodies larger than max_bytes while they are being received"""
+
+    def __init__(self, app, max_bytes, paths, setting="MAX_UPLOAD_BYTES"):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+        self.setting = setting
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        # Fast path: the client announced an oversized body
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                announced = int(content_length)
+            except ValueError:
+                announced = -1
+            if announced < 0:
+                return await self._reject(send, 400, "Invalid Content-Length header")
+            if announced > self.max_bytes:
+                return await self._reject(send, 413, self._detail())
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        return await self.app(scope, limited_receive, send)
+
+    def _detail(self):
+        return f"Upload exceeds {self.setting}={self.max_bytes}"
+
+    async def _reject(self, send, status, detail):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
 # ======================
 # CORS Middleware
 # ======================
@@ -31,6 +250,40 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MaxUploadSizeMiddleware, max_bytes=MAX_UPLOAD_BYTES, paths=UPLOAD_PATHS)
+app.add_middleware(MaxUploadSizeMiddleware, max_bytes=MAX_ARCHIVE_BYTES, paths={"/predict-images"},
+                   setting="MAX_ARCHIVE_BYTES")
+
+# ======================
+# Metrics
+# ======================
+# Set METRICS=0 to switch off all request and stage instrumentation
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+
+registry = Registry()
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Duration of feature extraction and inference stages", LATENCY_BUCKETS, ["stage"])
+upload_bytes = registry.histogram(
+    "image_upload_bytes", "Size of uploaded images",
+    [16 * 1024 * 4 ** i for i in range(8)])
+image_pixels = registry.histogram(
+    "image_pixels", "Pixel count of decoded images",
+    [256 * 256 * 4 ** i for i in range(7)])
+# Set TRACE_MEMORY=1 to also record the peak bytes allocated by each extraction
+# stage (tracemalloc; slows extraction down and is only exact with the process pool)
+TRACE_MEMORY = os.environ.get("TRACE_MEMORY", "0") == "1"
+stage_peak_bytes = registry.histogram(
+    "stage_peak_bytes", "Peak bytes allocated by feature extraction stages",
+    [1024 * 1024 * 4 ** i for i in range(8)], ["stage"])
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+def observe_stages(timings, peaks=None):
+    for name, seconds in timings.items():
+        stage_seconds.labels(name).observe(seconds)
+    for name, size in (peaks or {}).items():
+        stage_peak_bytes.labels(name).observe(size)
 
 # ======================
 # Input Schema
@@ -71,65 +324,346 @@ class CancerInput(BaseModel):
 
 FEATURE_ORDER = list(CancerInput.model_fields.keys())
 
+# ======================
+# Batch settings
+# ======================
+# Maximum number of rows accepted by /predict-batch in a single request
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+# Largest /predict-batch body (bytes), rejected with 413 while it is being
+# received. A row as a JSON object with 30 long field names and full-precision
+# floats stays under BATCH_ROW_BYTES.
+BATCH_ROW_BYTES = 2048
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", MAX_BATCH_SIZE * BATCH_ROW_BYTES))
+# Rows are scored in chunks of this size (one predict_proba call per chunk)
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 1024))
+app.add_middleware(MaxUploadSizeMiddleware, max_bytes=MAX_BATCH_BYTES, paths={"/predict-batch"},
+                   setting="MAX_BATCH_BYTES")
+
+# ======================
+# Micro-batching settings
+# ======================
+# Opt-in (MICROBATCH=1): concurrent /predict calls are collected for up to
+# MICROBATCH_MAX_WAIT_US microseconds or MICROBATCH_MAX_SIZE rows and scored
+# together in one model call
+MICROBATCH = os.environ.get("MICROBATCH", "0") == "1"
+MICROBATCH_MAX_WAIT_US = int(os.environ.get("MICROBATCH_MAX_WAIT_US", 2000))
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", 64))
+
+# ======================
+# Texture settings
+# ======================
+# Region the GLCM contrast is computed over:
+#   image - the whole image (default)
+#   bbox  - the bounding box of the tumor region
+#   mask  - pixel pairs inside the tumor region only
+TEXTURE_ROI = os.environ.get("TEXTURE_ROI", "image")
+# Gray levels the image is quantized to before counting co-occurrences (e.g. 32, 64).
+# "image" with 256 levels is the original full graycomatrix computation.
+TEXTURE_LEVELS = int(os.environ.get("TEXTURE_LEVELS", 256))
+TEXTURE_ROIS = ("image", "bbox", "mask")
+
+# Box counting for fractal_dimension over the whole mask ("image", default)
+# or only the tumor region's bounding box ("bbox")
+FRACTAL_ROI = os.environ.get("FRACTAL_ROI", "image")
+
+# Features of the largest region only ("largest", default), or statistics over
+# every segmented region ("nuclei"): mean, standard error and worst (mean of the
+# three largest values) as in the WBCD data
+FEATURE_MODE = os.environ.get("FEATURE_MODE", "largest")
+FEATURE_MODES = ("largest", "nuclei")
+
+# ======================
+# Feature store
+# ======================
+# Directory of the persistent feature store (unset = off). Extracted features
+# are kept per image hash, so a new model can re-score every image seen so far
+# without decoding it again (python score_batch.py $FEATURE_STORE_DIR out.csv)
+FEATURE_STORE_DIR = os.environ.get("FEATURE_STORE_DIR")
+
+def extraction_settings():
+    """Settings that change the extracted features; a feature store only holds one combination"""
+    return {"texture_roi": TEXTURE_ROI, "texture_levels": TEXTURE_LEVELS,
+            "fractal_roi": FRACTAL_ROI, "feature_mode": FEATURE_MODE, "decode_max_pixels": DECODE_MAX_PIXELS}
+
+result_cache = ResultCache(
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL,
+    namespace=content_hash(json.dumps({"model": file_hash(MODEL_PATH), **extraction_settings()},
+                                      sort_keys=True).encode()),
+    disk_path=os.path.join(RESULT_CACHE_DIR, "results.sqlite3") if RESULT_CACHE_DIR else None
+)
+
+def open_feature_store(path):
+    return FeatureStore(path, FEATURE_ORDER, meta=extraction_settings())
+
+feature_store = open_feature_store(FEATURE_STORE_DIR) if FEATURE_STORE_DIR else None
+
+# ======================
+# Extraction memory budget
+# ======================
+# Per-image memory budget in bytes; images whose whole-image extraction would
+# exceed it are processed in bands of rows (0 never tiles)
+EXTRACTION_MEMORY_BUDGET = int(os.environ.get("EXTRACTION_MEMORY_BUDGET", 256 * 1024 * 1024))
+# Objects smaller than this many pixels are dropped from the tumor mask
+MIN_OBJECT_SIZE = 50
+
+# LEAN_EXTRACTION=1 segments into per-worker buffers that are reused from image
+# to image (bool mask, int32 labels) and never makes full-size intp copies:
+# about half the default peak memory, same features
+LEAN_EXTRACTION = os.environ.get("LEAN_EXTRACTION", "0") == "1"
+work_buffers = WorkBuffers()
+
 # ======================
 # Image Processing Features
 # ======================
 def fractal_dimension(Z):
     """Estimate fractal dimension using box-counting"""
-    Z = (Z > 0).astype(int)
-    sizes = 2 ** np.arange(1, int(np.log2(min(Z.shape))))
-    counts = []
-    for size in sizes:
-        S = np.add.reduceat(np.add.reduceat(Z, np.arange(0, Z.shape[0], size), axis=0),
-                             np.arange(0, Z.shape[1], size), axis=1)
-        counts.append(np.sum(S > 0))
+    return box_count_slope(box_counts(Z, box_count_levels(Z.shape)))
+
+def box_count_levels(shape):
+    """Number of box sizes 2, 4, ... below the shorter side"""
+    return int(np.log2(min(shape))) - 1
+
+def box_count_slope(counts):
+    """Fractal dimension from the occupied box counts for sizes 2, 4, ..."""
     if len(counts) < 2:
         return 0.0
+    sizes = 2 ** np.arange(1, len(counts) + 1)
     coeffs = np.polyfit(np.log(sizes), np.log(counts), 1)
     return -coeffs[0]
 
-def extract_features(image_path):
-    # Load image in grayscale
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("Could not read image")
-    
-    # Step 1: Segment tumor
+def grayscale_flag(header, max_pixels=DECODE_MAX_PIXELS):
+    """cv2.imread flag for an image starting with header: reduced scale when it exceeds max_pixels"""
+    import cv2
+    if not max_pixels:
+        return cv2.IMREAD_GRAYSCALE
     try:
-        thresh_val = filters.threshold_otsu(img)
-    except Exception:
-        # Fallback if image is uniform
-        thresh_val = 128
+        found = read_header(header, complete=False)
+    except ImageHeaderError:
+        found = None
+    factor = 1 if found is None else reduction_factor(found[1], found[2], max_pixels)
+    return {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+            4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}[factor]
+
+def load_grayscale(image):
+    """Load an image as grayscale from a path, raw bytes, a file-like object or a 2D array"""
+    import cv2
+    if isinstance(image, np.ndarray) and image.ndim == 2:
+        return image
+    if isinstance(image, (str, os.PathLike)):
+        header = b""
+        if DECODE_MAX_PIXELS:
+            with open(image, "rb") as f:
+                header = f.read(HEADER_BYTES)
+        return cv2.imread(os.fspath(image), grayscale_flag(header))
+    if hasattr(image, "read"):
+        image = image.read()
+    # Decode straight from memory, no temporary file
+    buffer = np.frombuffer(image, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, grayscale_flag(image))
+
+def largest_region(labeled_img, img, n_labels=None):
+    """
+    regionprops of the largest component only, computed on its bounding box,
+    and that bounding box as slices of the image (None if there is no component)
+    """
+    from skimage import measure
+    found = largest_component(labeled_img, n_labels)
+    if found is None:
+        return None
+    box, mask = found
+    return measure.regionprops(mask.view(np.uint8), intensity_image=img[box])[0], box
+
+def texture_contrast(img, box, mask, roi=TEXTURE_ROI, levels=TEXTURE_LEVELS):
+    """GLCM contrast (distance 1, angle 0) of the image, the region's bounding box or its mask"""
+    if roi not in TEXTURE_ROIS:
+        raise ValueError(f"Unknown texture ROI {roi!r}, expected one of {TEXTURE_ROIS}")
+    if roi == "image" and levels == 256:
+        # FIXED: Updated to use 'gray' spelling for newer scikit-image versions
+        from skimage.feature import graycomatrix, graycoprops
+        glcm = graycomatrix(img, distances=[1], angles=[0], levels=256, symmetric=True, normed=True)
+        return graycoprops(glcm, 'contrast')[0,0]
+    if roi == "image":
+        return glcm_contrast(img, levels)
+    return glcm_contrast(img[box], levels, mask if roi == "mask" else None)
+
+def segment(img, timings=None, lean=False):
+    """Otsu threshold, then drop objects smaller than MIN_OBJECT_SIZE"""
+    # Heavy image libraries are imported on first use so the API can start
+    # (and answer /ready) before they are loaded
+    from skimage import filters, morphology
+
+    if lean:
+        with stage(timings, "threshold_otsu"):
+            thresh_val = otsu_threshold(img)
+        with stage(timings, "remove_small_objects"):
+            mask, labels = work_buffers.get(img.shape)
+            return segment_into(img, thresh_val, MIN_OBJECT_SIZE, mask, labels)
+
+    with stage(timings, "threshold_otsu"):
+        try:
+            thresh_val = filters.threshold_otsu(img)
+        except Exception:
+            # Fallback if image is uniform
+            thresh_val = 128
         
-    binary = img > thresh_val
-    binary = morphology.remove_small_objects(binary, 50)
+    with stage(timings, "remove_small_objects"):
+        binary = img > thresh_val
+        binary = morphology.remove_small_objects(binary, MIN_OBJECT_SIZE)
+    return binary
+
+def label_components(binary, lean=False):
+    """(8-connected labels, number of labels); lean labels live in the worker's buffer"""
+    from skimage import measure
+    if lean:
+        _, labels = work_buffers.get(binary.shape)
+        return labels, label_into(binary, labels)
+    return measure.label(binary, return_num=True)
+
+def tumor_measurements(img, timings=None, texture_roi=TEXTURE_ROI, texture_levels=TEXTURE_LEVELS,
+                       fractal_roi=FRACTAL_ROI, lean=False):
+    """(tumor region, fractal dimension, texture) of a whole image, or None if nothing is segmented"""
+    # Step 1: Segment tumor
+    binary = segment(img, timings, lean)
     
     # Step 2: Extract regions
-    labeled_img = measure.label(binary)
-    regions = measure.regionprops(labeled_img, intensity_image=img)
+    with stage(timings, "label_regionprops"):
+        labeled_img, n_labels = label_components(binary, lean)
+        # Take largest region as tumor (properties of the other components are never computed)
+        found = largest_region(labeled_img, img, n_labels)
     
-    if not regions:
-        # Fallback feature values
-        return {f: 0.0 for f in FEATURE_ORDER}
+    if found is None:
+        return None
 
-    # Take largest region as tumor
-    region = max(regions, key=lambda r: r.area)
-    
-    # Step 3: Compute shape features
-    area = region.area
-    perimeter = region.perimeter
-    radius = np.sqrt(area / np.pi)
-    compactness = perimeter**2 / (4*np.pi*area) if area > 0 else 0
-    concavity = region.eccentricity
-    concave_points = region.extent
-    symmetry = region.major_axis_length / (region.minor_axis_length + 1e-5)  # avoid divide by zero
-    fractal = fractal_dimension(binary)
+    region, box = found
+    with stage(timings, "fractal_dimension"):
+        fractal = fractal_dimension(binary[box] if fractal_roi == "bbox" else binary)
     
     # Step 4: Compute texture features
     # FIXED: using graycomatrix/graycoprops with 'a'
-    glcm = graycomatrix(img, distances=[1], angles=[0], levels=256, symmetric=True, normed=True)
-    texture = graycoprops(glcm, 'contrast')[0,0]
-    smoothness = region.mean_intensity
+    with stage(timings, "graycomatrix"):
+        texture = texture_contrast(img, box, region.image, texture_roi, texture_levels)
+    return region, fractal, texture
+
+def tumor_measurements_tiled(img, memory_budget, timings=None, texture_roi=TEXTURE_ROI,
+                             texture_levels=TEXTURE_LEVELS, fractal_roi=FRACTAL_ROI):
+    """Same as tumor_measurements, computed band by band within memory_budget bytes"""
+    from skimage import measure
+
+    rows = band_rows(img.shape, memory_budget)
+    with stage(timings, "threshold_otsu"):
+        thresh_val = otsu_threshold(img, rows)
+
+    whole_image_texture = texture_roi == "image"
+    tiles = TiledSegmentation(img, thresh_val, rows, MIN_OBJECT_SIZE, box_count_levels(img.shape),
+                              texture_levels if whole_image_texture else None, timings)
+    if tiles.box is None:
+        return None
+
+    with stage(timings, "label_regionprops"):
+        # Within its bounding box the tumor is still the largest component
+        binary = tiles.mask(tiles.box)
+        labeled_img, n_labels = measure.label(binary, return_num=True)
+        region, _ = largest_region(labeled_img, img[tiles.box], n_labels)
+
+    with stage(timings, "fractal_dimension"):
+        fractal = fractal_dimension(binary) if fractal_roi == "bbox" else box_count_slope(tiles.counts)
+
+    with stage(timings, "graycomatrix"):
+        if whole_image_texture:
+            texture = contrast_from_histogram(tiles.texture_hist, texture_levels)
+        else:
+            texture = texture_contrast(img, tiles.box, region.image, texture_roi, texture_levels)
+    return region, fractal, texture
+
+def nuclei_features(img, timings=None, texture_levels=TEXTURE_LEVELS, lean=False):
+    """
+    The 30 features as statistics over every segmented region (None if nothing
+    is segmented). The ten base features are computed for all regions at once,
+    as arrays over labels; texture uses each region's own pixel pairs.
+    """
+    binary = segment(img, timings, lean)
+    with stage(timings, "label_regionprops"):
+        labeled_img, n_labels = label_components(binary, lean)
+        if n_labels == 0:
+            return None
+        regions = LabeledRegions(labeled_img, n_labels)
+        shapes = region_shapes(regions, img)
+        perimeter = region_perimeters(regions)
+
+    with stage(timings, "fractal_dimension"):
+        fractal = region_box_dimension(regions, shapes["boxes"])
+
+    with stage(timings, "graycomatrix"):
+        texture = region_contrast(regions, img, texture_levels)
+
+    area = shapes["area"]
+    base_features = {
+        "radius": np.sqrt(area / np.pi),
+        "texture": texture,
+        "perimeter": perimeter,
+        "area": area,
+        "smoothness": shapes["mean_intensity"],
+        "compactness": perimeter**2 / (4*np.pi*area),
+        "concavity": shapes["eccentricity"],
+        "concave_points": shapes["extent"],
+        "symmetry": shapes["major_axis_length"] / (shapes["minor_axis_length"] + 1e-5),
+        "fractal_dimension": fractal,
+    }
+    features = {}
+    for name, values in base_features.items():
+        features[f'{name}_mean'], features[f'{name}_se'], features[f'{name}_worst'] = summarize(values)
+    return features
+
+def extract_features(image, timings=None, texture_roi=TEXTURE_ROI, texture_levels=TEXTURE_LEVELS,
+                     fractal_roi=FRACTAL_ROI, memory_budget=EXTRACTION_MEMORY_BUDGET,
+                     feature_mode=FEATURE_MODE, lean=LEAN_EXTRACTION):
+    """
+    Compute the 30 WBCD-style features of an image.
+
+    When a timings dict is given, the duration of each stage is added to it.
+    texture_roi, texture_levels, fractal_roi, memory_budget, feature_mode and
+    lean override the module settings.
+    """
+    if fractal_roi not in ("image", "bbox"):
+        raise ValueError(f"Unknown fractal ROI {fractal_roi!r}, expected 'image' or 'bbox'")
+    if feature_mode not in FEATURE_MODES:
+        raise ValueError(f"Unknown feature mode {feature_mode!r}, expected one of {FEATURE_MODES}")
+
+    # Load image in grayscale (path, bytes or in-memory buffer)
+    with stage(timings, "decode"):
+        img = load_grayscale(image)
+    if img is None:
+        raise ImageHeaderError("Could not decode image")
+
+    if feature_mode == "nuclei":
+        # Every region is needed at once, so this mode always works on the whole image
+        features = nuclei_features(img, timings, texture_levels, lean)
+        return features if features is not None else {f: 0.0 for f in FEATURE_ORDER}
+
+    bytes_per_pixel = LEAN_BYTES_PER_PIXEL if lean else IN_MEMORY_BYTES_PER_PIXEL
+    if needs_tiling(img.shape, memory_budget, bytes_per_pixel):
+        found = tumor_measurements_tiled(img, memory_budget, timings, texture_roi, texture_levels, fractal_roi)
+    else:
+        found = tumor_measurements(img, timings, texture_roi, texture_levels, fractal_roi, lean)
+
+    if found is None:
+        # Fallback feature values
+        return {f: 0.0 for f in FEATURE_ORDER}
+
+    region, fractal, texture = found
+    with stage(timings, "label_regionprops"):
+        # Step 3: Compute shape features
+        area = region.area
+        perimeter = region.perimeter
+        radius = np.sqrt(area / np.pi)
+        compactness = perimeter**2 / (4*np.pi*area) if area > 0 else 0
+        concavity = region.eccentricity
+        concave_points = region.extent
+        symmetry = region.major_axis_length / (region.minor_axis_length + 1e-5)  # avoid divide by zero
+        smoothness = region.mean_intensity
     
     # Combine features into a dictionary
     raw_features = [radius, texture, perimeter, area, smoothness,
@@ -151,6 +685,54 @@ def extract_features(image_path):
     
     return features
 
+def synthetic_image(size=256):
+    """Grayscale test image: a bright noisy disc on a dark background"""
+    import cv2
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 40, (size, size), dtype=np.uint8)
+    cv2.circle(img, (size // 2, size // 2), size // 4, 200, -1)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+def warm_worker():
+    """Process pool initializer: pay the first-call costs of cv2/skimage up front"""
+    extract_features(synthetic_image())
+
+def warmup():
+    """Load the model and run one synthetic extraction and prediction"""
+    load_model()
+    features = extract_features(synthetic_image())
+    score_rows(np.array([[features[f] for f in FEATURE_ORDER]]))
+    startup_state["warm"] = True
+
+def extract_features_timed(image, trace_memory=False):
+    """
+    extract_features plus its per-stage timings, the decoded pixel count and,
+    with trace_memory, the per-stage peak allocations (None otherwise)
+    """
+    timings = {}
+    with stage_memory() if trace_memory else nullcontext() as peaks:
+        with stage(timings, "decode"):
+            img = load_grayscale(image)
+        if img is None:
+            raise ImageHeaderError("Could not decode image")
+        features = extract_features(img, timings)
+    return features, timings, img.size, peaks
+
+async def run_extraction(data):
+    """Run extract_features on the process pool, or in a thread when the pool is off"""
+    fn, args = (extract_features_timed, (data, TRACE_MEMORY)) if METRICS_ENABLED else (extract_features, (data,))
+    if extraction_pool is None:
+        result = await run_in_threadpool(fn, *args)
+    else:
+        result = await extraction_pool.run(fn, *args)
+    if not METRICS_ENABLED:
+        return result
+
+    features, timings, pixels, peaks = result
+    observe_stages(timings, peaks)
+    image_pixels.labels().observe(pixels)
+    return features
+
 # ======================
 # Health check$
 #uvicorn app:app --reload
@@ -159,54 +741,354 @@ def extract_features(image_path):
 def health():
     return {"status": "FastAPI is running"}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    status = {
+        "mode": STARTUP_MODE,
+        "model_loaded": model is not None,
+        "warm": startup_state["warm"],
+        "image_workers": extraction_pool.workers if extraction_pool is not None else 0,
+    }
+    if startup_state["error"] is not None:
+        status["error"] = startup_state["error"]
+    is_ready = STARTUP_MODE == "lazy" or startup_state["warm"]
+    return JSONResponse(status_code=200 if is_ready else 503,
+                        content={"status": "ready" if is_ready else "starting", **status})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request, stage, cache and batching metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
 # ======================
 # Prediction endpoint
 # ======================
-@app.post("/predict")
+def format_prediction(label, confidence):
+    return {
+        "prediction": "Malignant" if label == 1 else "Benign",
+        # If your voting classifier supports probabilities
+        "confidence": None if confidence is None else float(confidence)
+    }
+
+def _vector_cache_key(X):
+    return "vec:" + content_hash(X.tobytes())
+
 def predict(data: CancerInput):
     # Convert input to NumPy array (correct order)
-    X = np.array([[getattr(data, f) for f in FEATURE_ORDER]])
+    X = np.array([[getattr(data, f) for f in FEATURE_ORDER]], dtype=float)
+
+    cache_key = _vector_cache_key(X)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    labels, confidences = score_rows(X)
+    result = format_prediction(labels[0], confidences[0])
+    result_cache.put(cache_key, result)
+    return result
 
-    prediction = model.predict(X)[0]
+def _score_batch(X):
+    labels, confidences = score_rows(X)
+    return [format_prediction(label, confidence) for label, confidence in zip(labels, confidences)]
+
+micro_batcher = (
+    MicroBatcher(_score_batch, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_US) if MICROBATCH else None
+)
+
+@registry.collector
+def _runtime_metrics():
+    cache = result_cache.stats()
+    lines = []
+    for name in ("hits", "misses", "evictions", "expirations", "disk_hits"):
+        lines += metric_lines(f"result_cache_{name}_total", f"Result cache {name.replace('_', ' ')}",
+                              "counter", [({}, cache[name])])
+    lines += metric_lines("result_cache_bytes", "Bytes held by the in-memory result cache",
+                          "gauge", [({}, cache["bytes"])])
+    pending = extraction_pool.pending if extraction_pool is not None else 0
+    lines += metric_lines("image_jobs_pending", "Image extraction jobs running or queued",
+                          "gauge", [({}, pending)])
+    if micro_batcher is not None:
+        lines += metric_lines("microbatch_batch_size", "Rows per micro-batch",
+                              "histogram", [({}, micro_batcher.batch_sizes)])
+        lines += metric_lines("microbatch_queue_delay_microseconds", "Time a row waited for its batch",
+                              "histogram", [({}, micro_batcher.queue_delay_us)])
+    return lines
+
+@app.post("/predict")
+async def predict_route(data: CancerInput):
+    if micro_batcher is None:
+        return await run_in_threadpool(predict, data)
 
-    # If your voting classifier supports probabilities
-    confidence = None
-    if hasattr(model, "predict_proba"):
-        confidence = float(model.predict_proba(X)[0].max())
+    X = np.array([[getattr(data, f) for f in FEATURE_ORDER]], dtype=float)
+    cache_key = _vector_cache_key(X)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Scored together with the other /predict calls waiting in the same window
+    result = await micro_batcher.submit(X[0])
+    result_cache.put(cache_key, result)
+    return result
+
+@app.get("/microbatch/stats")
+def microbatch_stats():
+    if micro_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **micro_batcher.stats()}
+
+# ======================
+# Batch Prediction endpoint
+# ======================
+def _format_validation_error(e):
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+    )
+
+def _parse_json_rows(payload):
+    """Return (rows, errors) where rows is a list of (index, feature list)"""
+    rows, errors = [], []
+
+    # Columnar form: {"columns": [...], "rows": [[...], ...]}
+    if isinstance(payload, dict):
+        columns = payload.get("columns", FEATURE_ORDER)
+        data = payload.get("rows")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="Expected a 'rows' list")
+        return _parse_columnar_rows(columns, data)
+
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Expected a list of rows")
+    _check_batch_size(len(payload))
+
+    # Record form: [{"radius_mean": ..., ...}, ...]
+    for i, row in enumerate(payload):
+        try:
+            item = CancerInput.model_validate(row)
+        except ValidationError as e:
+            errors.append((i, _format_validation_error(e)))
+            continue
+        rows.append((i, [getattr(item, f) for f in FEATURE_ORDER]))
+    return rows, errors
+
+def _parse_columnar_rows(columns, data):
+    if not isinstance(columns, list):
+        raise HTTPException(status_code=400, detail="Expected 'columns' to be a list of feature names")
+    missing = [f for f in FEATURE_ORDER if f not in columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+    _check_batch_size(len(data))
+
+    # Position of each feature in the incoming column order
+    positions = [columns.index(f) for f in FEATURE_ORDER]
+    rows, errors = [], []
+    for i, values in enumerate(data):
+        if not isinstance(values, (list, tuple)) or len(values) != len(columns):
+            errors.append((i, f"row: expected {len(columns)} values"))
+            continue
+        try:
+            rows.append((i, [float(values[p]) for p in positions]))
+        except (TypeError, ValueError) as e:
+            errors.append((i, f"row: {e}"))
+    return rows, errors
+
+def _parse_csv_rows(text):
+    reader = csv.reader(io.StringIO(text))
+    try:
+        columns = [c.strip() for c in next(reader)]
+    except StopIteration:
+        raise HTTPException(status_code=400, detail="Empty CSV body")
+    data = [values for values in reader if values]
+    return _parse_columnar_rows(columns, data)
+
+def _check_batch_size(n):
+    if n > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {n} rows exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}"
+        )
+
+def score_rows(X):
+    """Return (labels, confidences) for rows in FEATURE_ORDER from a single model pass"""
+    load_model()
+    timings = {} if METRICS_ENABLED else None
+    with stage(timings, "inference"):
+        if compiled_model is not None:
+            labels, proba = compiled_model.predict_with_proba(X)
+            result = labels, proba.max(axis=1)
+        elif hasattr(model, "predict_proba"):
+            proba = model.predict_proba(X)
+            result = model.classes_[proba.argmax(axis=1)], proba.max(axis=1)
+        else:
+            result = model.predict(X), [None] * len(X)
+    if timings:
+        observe_stages(timings)
+    return result
+
+def predict_matrix(X):
+    """Score a 2D array of rows in FEATURE_ORDER, one model call per chunk"""
+    labels, confidences = [], []
+    for start in range(0, len(X), BATCH_CHUNK_SIZE):
+        chunk_labels, chunk_confidences = score_rows(X[start:start + BATCH_CHUNK_SIZE])
+        labels.extend(chunk_labels)
+        confidences.extend(None if c is None else float(c) for c in chunk_confidences)
+    return labels, confidences
+
+@app.post("/predict-batch")
+async def predict_batch(request: Request):
+    """
+    Score many rows in one request.
+
+    Accepted bodies:
+    - application/json: a list of feature objects (same fields as /predict)
+    - application/json: {"columns": [...], "rows": [[...], ...]}
+    - text/csv: a header line with the feature names, then one row per line
+
+    At most MAX_BATCH_SIZE rows are accepted. Invalid rows are reported
+    individually and do not fail the rest of the batch.
+    """
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+
+    if content_type.startswith("text/csv"):
+        rows, errors = _parse_csv_rows(body.decode("utf-8-sig"))
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        rows, errors = _parse_json_rows(payload)
+
+    results = {i: {"index": i, "error": msg} for i, msg in errors}
+    if rows:
+        X = np.array([values for _, values in rows], dtype=float)
+        labels, confidences = await run_in_threadpool(predict_matrix, X)
+        for (i, _), label, confidence in zip(rows, labels, confidences):
+            results[i] = {"index": i, **format_prediction(label, confidence)}
 
     return {
-        "prediction": "Malignant" if prediction == 1 else "Benign",
-        "confidence": confidence
+        "results": [results[i] for i in sorted(results)],
+        "n_rows": len(results),
+        "n_errors": len(errors)
     }
 
 # ======================
 # Image Prediction endpoint
 # ======================
-@app.post("/predict-image")
-async def predict_image(file: UploadFile = File(...)):
-    temp_file = f"temp_{file.filename}"
+async def read_upload(file, max_bytes=None):
+    """Read an UploadFile into memory in chunks, enforcing max_bytes"""
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    data = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds MAX_UPLOAD_BYTES={max_bytes}")
+    return bytes(data)
+
+async def predict_image_bytes(data):
+    """Prediction and features for one encoded image, served from the cache when possible"""
+    if METRICS_ENABLED:
+        upload_bytes.labels().observe(len(data))
+
+    # Unsupported, oversized and truncated images never reach the decoder
     try:
-        # Save uploaded file
-        with open(temp_file, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Extract features
-        features_dict = extract_features(temp_file)
-        
-        # Create input object for prediction
-        input_data = CancerInput(**features_dict)
-        
-        # Get prediction using existing logic
-        result = predict(input_data)
-        
-        # Add features to result
-        result["features"] = features_dict
-        
-        return result
-        
+        check_image(data, MAX_IMAGE_PIXELS)
+    except ImageHeaderError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    # Resubmitted scans are answered from the cache without re-extraction
+    image_key = content_hash(data)
+    cache_key = "img:" + image_key
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Features of an image seen before come from the feature store, if enabled
+    features_dict = None
+    if feature_store is not None:
+        stored = await run_in_threadpool(feature_store.get, image_key)
+        if stored is not None:
+            features_dict = dict(zip(FEATURE_ORDER, stored.tolist()))
+
+    if features_dict is None:
+        # Extract features straight from the uploaded bytes, off the event loop
+        try:
+            features_dict = await run_extraction(data)
+        except ImageHeaderError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        if feature_store is not None:
+            await run_in_threadpool(feature_store.put, image_key, [features_dict[f] for f in FEATURE_ORDER])
+
+    # Create input object for prediction
+    input_data = CancerInput(**features_dict)
+
+    # Get prediction using existing logic; model loading and sklearn inference stay off the loop
+    result = await run_in_threadpool(predict, input_data)
+
+    # Add features to result
+    result["features"] = features_dict
+    result_cache.put(cache_key, result)
+    return result
+
+# The form is parsed by HeaderCheckingParser, so its schema is declared here
+UPLOAD_SCHEMA = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+@app.post("/predict-image", openapi_extra=UPLOAD_SCHEMA)
+async def predict_image(request: Request):
+    """Predict one image uploaded as the multipart field `file`"""
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+    parser = HeaderCheckingParser(request.headers, request.stream(), max_files=1)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    try:
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(status_code=400, detail="No file in the field 'file'")
+        data = await read_upload(file)
+        return await predict_image_bytes(data)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # Cleanup
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
\ No newline at end of file
+        await form.close()
+
+@app.post("/predict-images")
+async def predict_images(request: Request):
+    """
+    Predict every image of a multipart body (field name is free). Files may be
+    images or zip/tar archives of images. Results are streamed as NDJSON, one
+    line per image in completion order, then a summary line.
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+    parser = DiskSpoolingParser(request.headers, request.stream(), max_files=MAX_ARCHIVE_FILES)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    uploads = [value for _, value in form.multi_items() if not isinstance(value, str)]
+    if not uploads:
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files in the upload")
+
+    async def lines():
+        try:
+            images = iter_images(uploads, MAX_UPLOAD_BYTES)
+            async for line in stream_results(images, predict_image_bytes, ARCHIVE_CONCURRENCY):
+                yield line
+        finally:
+            await form.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,6 @@
+"""
+Benchmarks for feature extraction, model inference and API throughput.
+
+    python -m benchmarks run --out results.json
+    python -m benchmarks compare baseline.json results.json
+"""
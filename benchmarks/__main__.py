@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+
+from benchmarks.compare import compare_files
+from benchmarks.synthetic import SIZES
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _meta():
+    import cv2
+    import numpy
+    import skimage
+    import sklearn
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "opencv": cv2.__version__,
+        "scikit-image": skimage.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+def _parse_size(text):
+    h, _, w = text.partition("x")
+    return int(h), int(w or h)
+
+def run(args):
+    from benchmarks.extraction import bench_extraction, tiled_parity
+
+    sizes = [_parse_size(s) for s in args.sizes] if args.sizes else SIZES
+    if args.quick:
+        sizes = [s for s in sizes if s[0] * s[1] <= 1024 * 1024]
+
+    print("feature extraction")
+    results = {"extraction": bench_extraction(sizes, args.repeat, args.tile_budget * 2**20)}
+    results["tiled_parity"] = tiled_parity()
+
+    if not args.skip_api:
+        from benchmarks.api import bench_api
+        print("api")
+        results["api"] = bench_api(
+            n_requests=200 if args.quick else 2000,
+            concurrency=args.concurrency,
+            batch_rows=256,
+            image_shape=(512, 512),
+            n_images=8 if args.quick else 40,
+        )
+
+    report = {"meta": _meta(), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {args.out}")
+    if not all(results["tiled_parity"].values()):
+        sys.exit("tiled extraction does not match whole-image extraction")
+
+def main():
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write a JSON report")
+    run_parser.add_argument("--out", default="benchmark_results.json")
+    run_parser.add_argument("--sizes", nargs="+", help="image sizes as HxW (default: 256x256 ... 4096x3328)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="timed runs per image size (median is kept)")
+    run_parser.add_argument("--tile-budget", type=int, default=64,
+                            help="memory budget in MiB for the tiled extraction runs (0 skips them)")
+    run_parser.add_argument("--concurrency", type=int, default=16, help="concurrent API clients")
+    run_parser.add_argument("--skip-api", action="store_true", help="only benchmark feature extraction")
+    run_parser.add_argument("--quick", action="store_true", help="small sizes and fewer requests")
+
+    compare_parser = commands.add_parser("compare", help="compare two reports and flag regressions")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative change counted as a regression (default 0.1 = 10%%)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(1 if compare_files(args.old, args.new, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
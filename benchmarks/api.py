@@ -0,0 +1,118 @@
+"""Throughput and latency of the HTTP endpoints against a locally started app"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from app import FEATURE_ORDER
+from benchmarks.synthetic import encode_png, tumor_image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class LocalServer:
+    """uvicorn app:app in a subprocess, with the result cache off so every call does real work"""
+
+    def __init__(self, env=None, startup_timeout=120):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, "RESULT_CACHE_MAX_BYTES": "0", **(env or {})}
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=ROOT, env=self.env,
+            # Own process group, so image pool workers are stopped together with the server
+            start_new_session=True,
+        )
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            try:
+                if requests.get(f"{self.url}/ready", timeout=1).status_code == 200:
+                    return self
+            except requests.ConnectionError:
+                pass
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("API server did not become ready")
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.process = None
+
+
+def _summary(latencies, elapsed, units):
+    latencies = np.asarray(latencies) * 1e3
+    return {
+        "requests": int(latencies.size),
+        "throughput_per_s": units / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def load_test(send, payloads, concurrency, units_per_request=1):
+    """Send every payload with `concurrency` client threads; returns throughput and latency"""
+    session_pool = [requests.Session() for _ in range(concurrency)]
+
+    def one(i):
+        session = session_pool[i % concurrency]
+        start = time.perf_counter()
+        response = send(session, payloads[i])
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(len(payloads))))
+    return _summary(latencies, time.perf_counter() - start, units_per_request * len(payloads))
+
+def bench_api(n_requests, concurrency, batch_rows, image_shape, n_images, env=None, log=print):
+    rng = np.random.default_rng(0)
+    rows = [dict(zip(FEATURE_ORDER, map(float, rng.normal(size=len(FEATURE_ORDER))))) for _ in range(n_requests)]
+    batches = [
+        {"columns": FEATURE_ORDER, "rows": rng.normal(size=(batch_rows, len(FEATURE_ORDER))).tolist()}
+        for _ in range(max(n_requests // batch_rows, 4))
+    ]
+    images = [encode_png(tumor_image(image_shape, seed=i)) for i in range(n_images)]
+
+    # Admit every concurrent image job, so the run measures throughput rather than 503s
+    env = {"IMAGE_QUEUE_SIZE": str(concurrency), **(env or {})}
+    results = {}
+    with LocalServer(env) as server:
+        results["predict"] = load_test(
+            lambda s, row: s.post(f"{server.url}/predict", json=row), rows, concurrency)
+        log(f"  /predict        {results['predict']['throughput_per_s']:9.1f} req/s")
+
+        results["predict_batch"] = load_test(
+            lambda s, batch: s.post(f"{server.url}/predict-batch", json=batch), batches, concurrency,
+            units_per_request=batch_rows)
+        results["predict_batch"]["rows_per_request"] = batch_rows
+        log(f"  /predict-batch  {results['predict_batch']['throughput_per_s']:9.1f} rows/s")
+
+        results["predict_image"] = load_test(
+            lambda s, data: s.post(f"{server.url}/predict-image", files={"file": ("scan.png", data, "image/png")}),
+            images, concurrency)
+        results["predict_image"]["image"] = f"{image_shape[0]}x{image_shape[1]}"
+        log(f"  /predict-image  {results['predict_image']['throughput_per_s']:9.1f} img/s")
+    return results
@@ -0,0 +1,87 @@
+"""
+Parity check and latency benchmark: compiled NumPy engine vs the sklearn VotingClassifier.
+
+Run from the repository root:
+    python benchmarks/bench_compiled_model.py
+
+Parity is checked on the WBCD data (raw and standardized, 569 x 30) and on
+random rows; the script exits with status 1 if probabilities or labels differ.
+"""
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+from sklearn.datasets import load_breast_cancer
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compiled_model import compile_voting_classifier
+
+MODEL_PATH = "model/voting_classifier_model.pkl"
+ATOL = 1e-6
+
+
+def timed(fn, repeat):
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return float(np.median(samples))
+
+def check_parity(model, engine, datasets):
+    ok = True
+    for name, X in datasets.items():
+        expected_proba = model.predict_proba(X)
+        expected_labels = model.predict(X)
+        labels, proba = engine.predict_with_proba(X)
+        max_diff = float(np.abs(expected_proba - proba).max())
+        mismatches = int((expected_labels != labels).sum())
+        passed = max_diff <= ATOL and mismatches == 0
+        ok &= passed
+        print(f"{name:<14} rows={len(X):<6} max|dp|={max_diff:.2e} label mismatches={mismatches} "
+              f"{'OK' if passed else 'FAIL'}")
+    return ok
+
+def main():
+    warnings.filterwarnings("ignore")
+    model = joblib.load(MODEL_PATH)
+
+    start = time.perf_counter()
+    engine = compile_voting_classifier(model)
+    print(f"compiled {engine.n_trees} trees, {len(engine.nodes['left'])} nodes "
+          f"in {(time.perf_counter() - start) * 1e3:.1f} ms\n")
+
+    X = load_breast_cancer().data
+    rng = np.random.default_rng(0)
+    datasets = {
+        "wbcd": X,
+        "wbcd_scaled": StandardScaler().fit_transform(X),
+        "random": rng.normal(scale=3.0, size=(10000, X.shape[1])),
+    }
+    ok = check_parity(model, engine, datasets)
+
+    print("\nper-row latency (ms, median)")
+    row = datasets["wbcd_scaled"][:1]
+    sklearn_row = timed(lambda: (model.predict(row), model.predict_proba(row)), 50)
+    compiled_row = timed(lambda: engine.predict_with_proba(row), 500)
+    print(f"  sklearn predict + predict_proba: {sklearn_row:8.3f}")
+    print(f"  compiled predict_with_proba:     {compiled_row:8.3f}  ({sklearn_row / compiled_row:.0f}x)")
+
+    print("\nper-batch latency (ms, median)")
+    for n in (10, 100, 569, 10000):
+        batch = np.resize(datasets["wbcd_scaled"], (n, X.shape[1]))
+        sklearn_batch = timed(lambda: model.predict_proba(batch), 5)
+        compiled_batch = timed(lambda: engine.predict_with_proba(batch), 5)
+        print(f"  n={n:<6} sklearn {sklearn_batch:9.2f}  compiled {compiled_batch:9.2f}  "
+              f"({sklearn_batch / compiled_batch:.1f}x, {compiled_batch * 1e3 / n:.1f} us/row)")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
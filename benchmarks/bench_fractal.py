@@ -0,0 +1,81 @@
+"""
+Parity, latency and peak memory of fractal_dimension against the original
+reduceat implementation.
+
+Run from the repository root:
+    python benchmarks/bench_fractal.py
+
+Exits with status 1 if any slope differs from the original.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import fractal_dimension
+from benchmarks.synthetic import SIZES, tumor_image
+
+
+def reference_fractal_dimension(Z):
+    """The original implementation: int64 copy, two reduceat passes per box size"""
+    Z = (Z > 0).astype(int)
+    sizes = 2 ** np.arange(1, int(np.log2(min(Z.shape))))
+    counts = []
+    for size in sizes:
+        S = np.add.reduceat(np.add.reduceat(Z, np.arange(0, Z.shape[0], size), axis=0),
+                             np.arange(0, Z.shape[1], size), axis=1)
+        counts.append(np.sum(S > 0))
+    if len(counts) < 2:
+        return 0.0
+    coeffs = np.polyfit(np.log(sizes), np.log(counts), 1)
+    return -coeffs[0]
+
+def measure(fn, mask, repeat=3):
+    """(result, median ms, peak traced MiB)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(mask)
+        samples.append((time.perf_counter() - start) * 1e3)
+    tracemalloc.start()
+    fn(mask)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, float(np.median(samples)), peak
+
+def parity_inputs():
+    rng = np.random.default_rng(0)
+    for shape in [(4, 4), (8, 8), (37, 53), (64, 100), (255, 257), (513, 300)]:
+        for density in (0.01, 0.3, 0.9):
+            yield f"random {shape} p={density}", rng.random(shape) < density
+    for shape in SIZES[:3]:
+        img = tumor_image(shape)
+        yield f"tumor {shape}", img > np.median(img)
+
+def main():
+    warnings.filterwarnings("ignore")
+    ok = True
+    for name, mask in parity_inputs():
+        expected, got = reference_fractal_dimension(mask), fractal_dimension(mask)
+        if not np.isclose(expected, got, rtol=0, atol=1e-12, equal_nan=True):
+            ok = False
+            print(f"FAIL {name}: {expected} != {got}")
+    print(f"parity: {'OK' if ok else 'FAIL'}\n")
+
+    print(f"{'size':<12}{'original ms':>14}{'pyramid ms':>12}{'original MiB':>15}{'pyramid MiB':>13}")
+    for shape in SIZES:
+        img = tumor_image(shape)
+        mask = img > np.median(img)
+        _, ref_ms, ref_peak = measure(reference_fractal_dimension, mask)
+        _, new_ms, new_peak = measure(fractal_dimension, mask)
+        print(f"{f'{shape[0]}x{shape[1]}':<12}{ref_ms:14.1f}{new_ms:12.1f}{ref_peak:15.1f}{new_peak:13.1f}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
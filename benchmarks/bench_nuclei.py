@@ -0,0 +1,82 @@
+"""
+Vectorized per-region features (FEATURE_MODE=nuclei) vs a regionprops loop.
+
+Run from the repository root:
+    python benchmarks/bench_nuclei.py
+
+Images carry hundreds of nuclei-like blobs. Every per-region value must
+match the loop over regionprops (fractal dimension and texture of each
+region's own mask included), and a 1024x1024 image with 500+ regions must
+be processed within TARGET_MS; the script exits with status 1 otherwise.
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+from skimage import measure
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import TEXTURE_LEVELS, fractal_dimension, segment
+from benchmarks.synthetic import blob_image
+from feature_kernels import (LabeledRegions, glcm_contrast, region_box_dimension, region_contrast,
+                             region_perimeters, region_shapes)
+
+CASES = [((512, 512), 300), ((1024, 1024), 800), ((2048, 2048), 3000)]
+# Latency target of the vectorized path at 1024x1024 with 500+ regions
+TARGET_MS = 150
+PROPERTIES = ["area", "mean_intensity", "extent", "eccentricity", "major_axis_length",
+              "minor_axis_length", "perimeter"]
+
+
+def reference_values(labeled_img, img, levels):
+    """The naive path: one regionprops object, box count and GLCM per region"""
+    values = {p: [] for p in PROPERTIES + ["fractal_dimension", "texture"]}
+    for region in measure.regionprops(labeled_img, intensity_image=img):
+        for p in PROPERTIES:
+            values[p].append(getattr(region, p))
+        values["fractal_dimension"].append(fractal_dimension(region.image))
+        values["texture"].append(glcm_contrast(img[region.slice], levels, region.image))
+    return {k: np.array(v) for k, v in values.items()}
+
+def vectorized_values(labeled_img, n_labels, img, levels):
+    regions = LabeledRegions(labeled_img, n_labels)
+    values = region_shapes(regions, img)
+    values["perimeter"] = region_perimeters(regions)
+    values["fractal_dimension"] = region_box_dimension(regions, values["boxes"])
+    values["texture"] = region_contrast(regions, img, levels)
+    return values
+
+def timed(fn, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return result, float(np.median(samples))
+
+def main():
+    warnings.filterwarnings("ignore")
+    ok = True
+    print(f"{'image':<11}{'regions':>8}{'loop ms':>10}{'label ms':>10}{'vectorized ms':>15}  parity")
+    for shape, n_blobs in CASES:
+        img = blob_image(shape, n_blobs)
+        binary = segment(img)
+        (labeled_img, n_labels), label_ms = timed(lambda: measure.label(binary, return_num=True))
+
+        expected, loop_ms = timed(lambda: reference_values(labeled_img, img, TEXTURE_LEVELS), repeat=1)
+        values, new_ms = timed(lambda: vectorized_values(labeled_img, n_labels, img, TEXTURE_LEVELS))
+        same = all(np.allclose(expected[k], values[k], rtol=1e-12, atol=1e-9) for k in expected)
+        ok &= same
+        if shape == (1024, 1024) and n_labels >= 500 and label_ms + new_ms > TARGET_MS:
+            print(f"target missed: {label_ms + new_ms:.1f} ms > {TARGET_MS} ms")
+            ok = False
+        print(f"{f'{shape[0]}x{shape[1]}':<11}{n_labels:>8}{loop_ms:10.1f}{label_ms:10.1f}{new_ms:15.1f}  "
+              f"{'OK' if same else 'FAIL'}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
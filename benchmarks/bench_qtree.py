@@ -0,0 +1,304 @@
+"""
+Q-learning tree environment: presorted TreeEnv vs the notebook's np.unique version.
+
+Run from the repository root:
+    python benchmarks/bench_qtree.py
+
+Rows beyond the 569 WBCD samples are drawn from them with a little noise, so
+every size has realistic, mostly distinct feature values. For each size the
+candidate actions of random nodes must match the notebook's exactly; the
+script exits with status 1 otherwise. It then times the candidate
+thresholds of the root and of nodes with half and a tenth of the rows, the full
+get_possible_actions list at the root, and the first STEPS steps of a
+training episode (a whole episode takes one step per peeled-off sample, so
+only 569 rows run one to the end).
+
+Next, the information gain of every root action: TreeEnv.split_gains in one
+call against information_gain one action at a time. The two must be equal
+to the bit on GAIN_SAMPLE actions (all of them at 569 rows), and the
+per-action time of the scalar path is extrapolated to every action.
+
+Then the memory of the Q-table after MEMORY_EPISODES episodes on the WBCD
+data, per episode: the notebook's dict keyed by (tuple(indices), (f, t)),
+rebuilt from the same entries, against QTable, with and without a state cap.
+
+Last, whole training episodes per second on the WBCD data, THROUGHPUT_EPISODES
+episodes each: the notebook's dict (keyed by state fingerprint and (f, t),
+so both sides hash the same states) whose greedy choice and next-state max
+scan every action of the node, QTable read the same way (values of all
+actions, max over the state's values), and train with QTable's running
+best. All three must end with the same Q values.
+
+Finally, prediction on PREDICT_ROWS rows with a depth-5 tree trained on the
+WBCD data: predict_tree against CompiledQTree.predict, before and after an
+.npz round trip. All labels must be equal. The pickled node tree, which
+keeps every node's training indices, is compared with the .npz file.
+"""
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.datasets import load_breast_cancer
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qtree import CompiledQTree, QDecisionTreeNode, QTable, TreeEnv, compile_tree, predict_tree, run_episode, train
+
+SIZES = [569, 10_000, 100_000]
+STEPS = 5
+GAIN_SAMPLE = 500
+MEMORY_EPISODES = 50
+MAX_STATES = 200
+THROUGHPUT_EPISODES = 10
+PREDICT_ROWS = 1_000_000
+
+
+class NotebookTreeEnv(TreeEnv):
+    """The notebook's get_possible_actions: np.unique of every feature on every call"""
+
+    def thresholds(self, indices):
+        return [np.unique(self.X[indices, f]) for f in range(self.n_features)]
+
+    def get_possible_actions(self, indices):
+        actions = []
+        for f in range(self.n_features):
+            thresholds = np.unique(self.X[indices, f])
+            for t in thresholds:
+                actions.append((f, t))
+        return actions
+
+
+class RecordingTreeEnv(TreeEnv):
+    """Remembers the samples of every state it fingerprints"""
+
+    def __init__(self, X, y):
+        super().__init__(X, y)
+        self.members = {}
+
+    def state_key(self, indices):
+        key = super().state_key(indices)
+        self.members[key] = np.array(indices)
+        return key
+
+
+def wbcd_rows(n, seed=0):
+    """n standardized rows like the WBCD data (the data itself when n == 569)"""
+    X, y = load_breast_cancer(return_X_y=True)
+    if n != len(y):
+        rng = np.random.default_rng(seed)
+        pick = rng.integers(0, len(y), n)
+        X = X[pick] * rng.normal(1, 0.02, (n, X.shape[1]))
+        y = y[pick]
+    return StandardScaler().fit_transform(X), y
+
+def timed(fn, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return result, float(np.median(samples))
+
+def same_actions(env, reference, rng):
+    for size in (len(env.y), len(env.y) // 2, 50, 2):
+        indices = np.sort(rng.choice(len(env.y), size, replace=False))
+        if env.get_possible_actions(indices) != reference.get_possible_actions(indices):
+            return False
+    return True
+
+def episode_ms_per_step(env, max_steps):
+    start = time.perf_counter()
+    steps = run_episode(env, QTable(), rng=np.random.RandomState(0), max_steps=max_steps)
+    return (time.perf_counter() - start) * 1e3 / steps, steps
+
+def bench_gains(env, rng):
+    """(parity, scalar ms for all root actions (extrapolated), split_gains ms)"""
+    root = np.arange(len(env.y))
+    (features, thresholds, gains), vector_ms = timed(lambda: env.split_gains(root))
+    n_actions = len(gains)
+    sample = np.arange(n_actions) if len(env.y) == 569 else rng.choice(n_actions, GAIN_SAMPLE, replace=False)
+    start = time.perf_counter()
+    scalar = [env.step(root, (features[i], thresholds[i]))[2] for i in sample]
+    scalar_ms = (time.perf_counter() - start) * 1e3 * n_actions / len(sample)
+    return np.array_equal(scalar, gains[sample]), scalar_ms, vector_ms
+
+def traced_bytes(fn):
+    """(result of fn(), bytes it allocated and still holds)"""
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+def notebook_q_table(env, Q):
+    """The notebook's dict with the entries of Q: (tuple(indices), (f, t)) -> value"""
+    table = {}
+    for state, ids, values in Q.items():
+        indices = env.members[state]
+        for i, value in zip(ids.tolist(), values.tolist()):
+            f = int(np.searchsorted(env.action_offsets, i, side="right")) - 1
+            # Every key was created at its own step, so each holds its own tuple of the node's indices
+            table[(tuple(indices), (f, float(env.distinct[f][i - env.action_offsets[f]])))] = value
+    return table
+
+def bench_memory():
+    X, y = wbcd_rows(569)
+    env = RecordingTreeEnv(X, y)
+    Q = train(env, MEMORY_EPISODES, rng=np.random.RandomState(0))
+    table, notebook_bytes = traced_bytes(lambda: notebook_q_table(env, Q))
+    rows = [("notebook dict", len(table), notebook_bytes)]
+    for max_states in (None, MAX_STATES):
+        env = TreeEnv(X, y)
+        Q, size = traced_bytes(lambda: train(env, MEMORY_EPISODES, rng=np.random.RandomState(0),
+                                             max_states=max_states))
+        label = "QTable" if max_states is None else f"QTable, {max_states} states"
+        rows.append((label, len(Q), size))
+    return rows
+
+def dict_scan_episode(env, Q, alpha=0.1, gamma=0.9, epsilon=0.1, rng=np.random):
+    """The notebook's loop: a dict of (state, (f, t)) and a scan of every action for each max"""
+    indices = np.arange(len(env.y))
+    done = False
+    while not done:
+        state = env.state_key(indices)
+        actions = env.get_possible_actions(indices)
+        if not actions:
+            break
+        if rng.rand() < epsilon:
+            action = actions[rng.randint(len(actions))]
+        else:
+            action = actions[np.argmax([Q.get((state, a), 0) for a in actions])]
+        left, right, reward = env.step(indices, action)
+        max_next = 0
+        for next_indices in (left, right):
+            next_state = env.state_key(next_indices)
+            for a_next in env.get_possible_actions(next_indices):
+                max_next = max(max_next, Q.get((next_state, a_next), 0))
+        old = Q.get((state, action), 0)
+        Q[(state, action)] = old + alpha * (reward + gamma*max_next - old)
+        indices = left if len(left) >= len(right) else right
+        if len(left) == 0 or len(right) == 0:
+            done = True
+
+def table_scan_episode(env, Q, alpha=0.1, gamma=0.9, epsilon=0.1, rng=np.random):
+    """run_episode reading the QTable without its running best: every action's value, then the max"""
+    indices = np.arange(len(env.y))
+    done = False
+    while not done:
+        state = env.state_key(indices)
+        features, thresholds, ids = env.actions(indices)
+        if not len(ids):
+            break
+        i = rng.randint(len(ids)) if rng.rand() < epsilon else np.argmax(Q.values(state, ids))
+        left, right, reward = env.step(indices, (int(features[i]), float(thresholds[i])))
+        max_next = max(max(0, Q.values(env.state_key(n), env.actions(n)[2]).max(initial=0))
+                       for n in (left, right))
+        old = Q.get(state, ids[i])
+        Q.set(state, ids[i], old + alpha * (reward + gamma*max_next - old))
+        indices = left if len(left) >= len(right) else right
+        if len(left) == 0 or len(right) == 0:
+            done = True
+
+def bench_throughput():
+    """[(label, episodes/s)] and whether all three Q-tables hold the same values"""
+    X, y = wbcd_rows(569)
+    env = TreeEnv(X, y)
+    rows, tables = [], []
+    for label, episode, Q in (("dict, scan", dict_scan_episode, {}),
+                              ("QTable, scan", table_scan_episode, QTable()),
+                              ("QTable, running best", run_episode, QTable())):
+        rng = np.random.RandomState(0)
+        start = time.perf_counter()
+        for _ in range(THROUGHPUT_EPISODES):
+            episode(env, Q, rng=rng)
+        rows.append((label, THROUGHPUT_EPISODES / (time.perf_counter() - start)))
+        values = Q.values() if isinstance(Q, dict) else np.concatenate([v for _, _, v in Q.items()])
+        tables.append(sorted(values))
+    return rows, all(t == tables[0] for t in tables)
+
+def bench_predict():
+    """(nodes, predict_tree ms, compiled ms, loaded ms, pickle bytes, .npz bytes, parity)"""
+    X, y = wbcd_rows(569)
+    env = TreeEnv(X, y)
+    root = QDecisionTreeNode(np.arange(len(y)))
+    root.build(env, train(env, rng=np.random.RandomState(0)))
+    tree = compile_tree(root)
+    rows, _ = wbcd_rows(PREDICT_ROWS, seed=1)
+
+    expected, tree_ms = timed(lambda: predict_tree(root, rows), repeat=1)
+    labels, compiled_ms = timed(lambda: tree.predict(rows))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tree.npz")
+        tree.save(path)
+        npz_bytes = os.path.getsize(path)
+        loaded, loaded_ms = timed(lambda: CompiledQTree.load(path).predict(rows))
+    same = np.array_equal(labels, expected) and np.array_equal(loaded, expected)
+    return len(tree), tree_ms, compiled_ms, loaded_ms, len(pickle.dumps(root)), npz_bytes, same
+
+def main():
+    ok = True
+    print("ms, notebook -> presorted")
+    print(f"{'rows':>8}{'actions':>10}{'index':>8}{'root thresholds':>18}{'1/2 thresholds':>18}{'1/10 thresholds':>18}"
+          f"{'root actions':>18}{'episode step':>18}  parity")
+    for n in SIZES:
+        X, y = wbcd_rows(n)
+        env, build_ms = timed(lambda: TreeEnv(X, y), repeat=1)
+        reference = NotebookTreeEnv(X, y)
+        same = same_actions(env, reference, np.random.default_rng(n))
+        ok &= same
+
+        root = np.arange(n)
+        half, tenth = (np.sort(np.random.default_rng(0).choice(n, n // k, replace=False)) for k in (2, 10))
+        columns = []
+        for indices in (root, half, tenth):
+            columns.append([timed(lambda: e.thresholds(indices))[1] for e in (reference, env)])
+        actions, old_ms = timed(lambda: reference.get_possible_actions(root))
+        _, new_ms = timed(lambda: env.get_possible_actions(root))
+        columns.append([old_ms, new_ms])
+        max_steps = None if n == 569 else STEPS
+        old_step, old_steps = episode_ms_per_step(reference, max_steps)
+        new_step, new_steps = episode_ms_per_step(env, max_steps)
+        ok &= old_steps == new_steps
+        columns.append([old_step, new_step])
+        print(f"{n:>8}{len(actions):>10}{build_ms:8.1f}"
+              + "".join(f"{f'{old:.1f} -> {new:.1f}':>18}" for old, new in columns)
+              + f"  {'OK' if same else 'FAIL'}")
+
+    print("\ninformation gain of every root action, ms")
+    print(f"{'rows':>8}{'per action':>14}{'split_gains':>14}  parity")
+    for n in SIZES:
+        X, y = wbcd_rows(n)
+        same, scalar_ms, vector_ms = bench_gains(TreeEnv(X, y), np.random.default_rng(n))
+        ok &= same
+        print(f"{n:>8}{scalar_ms:14.1f}{vector_ms:14.1f}  {'OK' if same else 'FAIL'}")
+
+    print(f"\nQ-table after {MEMORY_EPISODES} episodes on the WBCD data (569 rows)")
+    print(f"{'':<22}{'entries':>9}{'KiB':>10}{'KiB/episode':>13}")
+    for label, entries, size in bench_memory():
+        print(f"{label:<22}{entries:>9}{size / 1024:10.0f}{size / 1024 / MEMORY_EPISODES:13.1f}")
+
+    print(f"\ntraining on the WBCD data, {THROUGHPUT_EPISODES} episodes")
+    rows, same = bench_throughput()
+    ok &= same
+    print(f"{'':<22}{'episodes/s':>12}")
+    for label, rate in rows:
+        print(f"{label:<22}{rate:12.2f}")
+    print(f"same Q values: {'OK' if same else 'FAIL'}")
+
+    n_nodes, tree_ms, compiled_ms, loaded_ms, pickle_bytes, npz_bytes, same = bench_predict()
+    ok &= same
+    print(f"\nprediction on {PREDICT_ROWS} rows, {n_nodes}-node tree, ms")
+    print(f"{'predict_tree':>14}{'compiled':>10}{'from .npz':>11}{'pickle KiB':>12}{'.npz KiB':>10}  parity")
+    print(f"{tree_ms:14.0f}{compiled_ms:10.0f}{loaded_ms:11.0f}{pickle_bytes / 1024:12.1f}{npz_bytes / 1024:10.1f}"
+          f"  {'OK' if same else 'FAIL'}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Q-learning tree trained on 1, 2, 4 and 8 worker processes (qtree.train_parallel).
+
+Run from the repository root:
+    python benchmarks/bench_qtree_parallel.py [--rows 10000] [--episodes 200] [--sync-every 10]
+
+The rows are split 70/30 like the notebook (random_state=0). Every worker
+count trains EPISODES episodes from scratch, and the tree is built from the
+merged Q-table. For each count the script reports episodes/s (pool start-up
+included) and the tree's test accuracy. Rows beyond the 569 WBCD samples
+are noisy copies of them (see bench_qtree.wbcd_rows), so their test
+accuracy is optimistic.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_qtree import wbcd_rows
+from qtree import QDecisionTreeNode, TreeEnv, predict_tree, train_parallel
+
+WORKERS = [1, 2, 4, 8]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=569)
+    parser.add_argument("--episodes", type=int, default=200)
+    parser.add_argument("--sync-every", type=int, default=10, help="episodes per worker between merges")
+    args = parser.parse_args()
+
+    X, y = wbcd_rows(args.rows)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=0)
+    env = TreeEnv(X_train, y_train)
+    print(f"{args.rows} rows, {args.episodes} episodes, merged every {args.sync_every} episodes per worker "
+          f"({os.cpu_count()} CPUs)")
+    print(f"{'workers':>8}{'episodes/s':>12}{'states':>10}{'accuracy':>10}")
+    for workers in WORKERS:
+        start = time.perf_counter()
+        Q = train_parallel(env, args.episodes, workers, args.sync_every)
+        rate = args.episodes / (time.perf_counter() - start)
+        root = QDecisionTreeNode(np.arange(len(y_train)))
+        root.build(env, Q)
+        accuracy = np.mean(predict_tree(root, X_test) == y_test)
+        print(f"{workers:>8}{rate:12.1f}{Q.n_states:>10}{accuracy:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
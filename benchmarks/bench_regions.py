@@ -0,0 +1,69 @@
+"""
+Largest-component region analysis vs regionprops over every component.
+
+Run from the repository root:
+    python benchmarks/bench_regions.py
+
+Images carry hundreds to thousands of blobs that survive small-object
+removal. The properties extract_features reads must be identical for both
+paths; the script exits with status 1 otherwise.
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+from skimage import filters, measure, morphology
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import largest_region
+from benchmarks.synthetic import blob_image
+
+# What extract_features reads from the tumor region
+PROPERTIES = ["area", "perimeter", "eccentricity", "extent", "major_axis_length",
+              "minor_axis_length", "mean_intensity"]
+CASES = [((1024, 1024), 0), ((1024, 1024), 500), ((1024, 1024), 2000), ((2048, 2048), 5000)]
+
+
+def reference_region(labeled_img, img):
+    """The original path: regionprops over all components, then max by area"""
+    regions = measure.regionprops(labeled_img, intensity_image=img)
+    region = max(regions, key=lambda r: r.area)
+    return region, {p: getattr(region, p) for p in PROPERTIES}
+
+def fast_region(labeled_img, img, n_labels):
+    region, box = largest_region(labeled_img, img, n_labels)
+    return region, {p: getattr(region, p) for p in PROPERTIES}, box
+
+def timed(fn, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return result, float(np.median(samples))
+
+def main():
+    warnings.filterwarnings("ignore")
+    ok = True
+    print(f"{'image':<11}{'blobs':>6}{'components':>12}{'regionprops ms':>16}{'largest ms':>12}  parity")
+    for shape, n_blobs in CASES:
+        img = blob_image(shape, n_blobs)
+        binary = morphology.remove_small_objects(img > filters.threshold_otsu(img), 50)
+        labeled_img, n_labels = measure.label(binary, return_num=True)
+
+        (expected, expected_props), ref_ms = timed(lambda: reference_region(labeled_img, img))
+        (region, props, box), new_ms = timed(lambda: fast_region(labeled_img, img, n_labels))
+        same = all(np.isclose(expected_props[p], props[p], rtol=0, atol=1e-9) for p in PROPERTIES)
+        same &= expected.bbox == (box[0].start, box[1].start, box[0].stop, box[1].stop)
+        same &= np.array_equal(expected.image, region.image)
+        ok &= same
+        print(f"{f'{shape[0]}x{shape[1]}':<11}{n_blobs:>6}{labeled_img.max():>12}{ref_ms:16.2f}{new_ms:12.2f}  "
+              f"{'OK' if same else 'FAIL'}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Accuracy and latency of the texture (GLCM contrast) modes.
+
+Run from the repository root:
+    python benchmarks/bench_texture.py
+
+The reference is the original computation: graycomatrix over the whole image
+with 256 levels. Every other ROI / quantization setting is compared with it on
+synthetic tumor images: texture stage latency, relative change of the
+texture_mean feature, and how often the model's prediction changes.
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from benchmarks.synthetic import tumor_image
+
+MODES = [("image", 256), ("image", 64), ("image", 32),
+         ("bbox", 256), ("bbox", 64), ("bbox", 32),
+         ("mask", 256), ("mask", 64), ("mask", 32)]
+LATENCY_SIZES = [(1024, 1024), (4096, 3328)]
+N_IMAGES = 40
+
+
+def texture_latency(img, roi, levels, repeat=5):
+    """Median duration of the texture stage in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        timings = {}
+        app.extract_features(img, timings, texture_roi=roi, texture_levels=levels)
+        samples.append(timings["graycomatrix"] * 1e3)
+    return float(np.median(samples))
+
+def score(features):
+    X = np.array([[f[name] for name in app.FEATURE_ORDER] for f in features])
+    labels, confidences = app.score_rows(X)
+    # Probability of the malignant class, whatever the predicted label
+    return labels, np.where(labels == 1, confidences, 1 - confidences)
+
+def main():
+    warnings.filterwarnings("ignore")
+    images = [tumor_image((512, 512), seed=seed) for seed in range(N_IMAGES)]
+    reference = [app.extract_features(img) for img in images]
+    ref_labels, ref_proba = score(reference)
+    large = {shape: tumor_image(shape) for shape in LATENCY_SIZES}
+
+    header = "".join(f"{f'{h}x{w} ms':>16}" for h, w in LATENCY_SIZES)
+    print(f"{'roi':<6}{'levels':>7}{header}{'texture rel. diff':>20}{'label flips':>13}{'max |dp|':>10}")
+    for roi, levels in MODES:
+        latencies = "".join(f"{texture_latency(img, roi, levels):16.2f}" for img in large.values())
+        features = [app.extract_features(img, texture_roi=roi, texture_levels=levels) for img in images]
+        rel = np.array([abs(f["texture_mean"] - r["texture_mean"]) / r["texture_mean"]
+                        for f, r in zip(features, reference)])
+        labels, proba = score(features)
+        print(f"{roi:<6}{levels:>7}{latencies}{np.median(rel):20.2%}"
+              f"{int((labels != ref_labels).sum()):>8}/{N_IMAGES:<4}{np.abs(proba - ref_proba).max():10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compare two benchmark result files and flag regressions"""
+import json
+
+# Metrics where a larger value is better; everything else (seconds, ms, bytes) is lower-is-better
+HIGHER_IS_BETTER = ("throughput_per_s",)
+# Descriptive fields that are not measurements
+IGNORED = ("pixels", "png_bytes", "requests", "rows_per_request", "memory_budget_mb")
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in IGNORED:
+            flat[name] = float(value)
+    return flat
+
+def compare(old, new, threshold):
+    """Rows (metric, old, new, relative change, regressed) for metrics present in both runs"""
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for name in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[name], new_flat[name]
+        change = (after - before) / before if before else 0.0
+        if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER:
+            regressed = change < -threshold
+        else:
+            regressed = change > threshold
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+def compare_files(old_path, new_path, threshold, log=print):
+    """Print the comparison table; returns the number of regressed metrics"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    rows = compare(old, new, threshold)
+    width = max((len(name) for name, *_ in rows), default=10)
+    for name, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        log(f"{name:<{width}}  {before:12.5g}  {after:12.5g}  {change:+7.1%}  {flag}")
+
+    regressions = sum(row[-1] for row in rows)
+    log(f"\n{len(rows)} metrics compared, {regressions} regressed by more than {threshold:.0%}")
+    return regressions
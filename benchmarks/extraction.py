@@ -0,0 +1,150 @@
+"""Per-stage timings and peak memory of extract_features on synthetic images"""
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import EXTRACTION_MEMORY_BUDGET, extract_features, fractal_dimension, needs_tiling
+from benchmarks.synthetic import encode_png, tumor_image
+from metrics import stage_memory
+
+
+# Shapes whose tiled features must match whole-image extraction: a regular
+# image and strips too thin for any box count level aligned to the bands
+TILED_PARITY_SHAPES = [(512, 512), (1, 100000), (2, 200000), (3, 100000), (200000, 2)]
+# Small enough to tile every parity shape
+TILED_PARITY_BUDGET = 16 * 1024
+
+
+def _median(values):
+    return float(np.median(values))
+
+def _peak_rss_kib():
+    """High-water RSS of this process (VmHWM; ru_maxrss would include the parent it was forked from)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmHWM not available")
+
+def _extraction_peak_rss(path, warmup_path, memory_budget, lean):
+    """
+    In a fresh process: growth of the peak RSS in MiB while decoding and
+    extracting the PNG at path
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    # Imports and first-call costs are not part of the measurement
+    extract_features(warmup_path, memory_budget=memory_budget, lean=lean)
+    before = _peak_rss_kib()
+    extract_features(data, memory_budget=memory_budget, lean=lean)
+    return (_peak_rss_kib() - before) / 1024
+
+def peak_rss_mb(img, memory_budget, lean=False, data=None):
+    """data is img encoded as PNG (encoded here when not given)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, warmup_path = os.path.join(tmp, "image.png"), os.path.join(tmp, "warmup.png")
+        with open(path, "wb") as f:
+            f.write(encode_png(img) if data is None else data)
+        with open(warmup_path, "wb") as f:
+            f.write(encode_png(np.ascontiguousarray(img[:256, :256])))
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return pool.submit(_extraction_peak_rss, path, warmup_path, memory_budget, lean).result()
+
+def bench_image(img, repeat, memory_budget=EXTRACTION_MEMORY_BUDGET, lean=False):
+    """
+    Timings of extract_features on img encoded as PNG, so the decode stage and
+    the total include decoding, like an upload
+    """
+    data = encode_png(img)
+    stages, totals, fractal = {}, [], []
+    extract_features(data, memory_budget=memory_budget, lean=lean)  # first-call costs are not part of the measurement
+
+    for _ in range(repeat):
+        timings = {}
+        start = time.perf_counter()
+        extract_features(data, timings, memory_budget=memory_budget, lean=lean)
+        totals.append(time.perf_counter() - start)
+        for name, seconds in timings.items():
+            stages.setdefault(name, []).append(seconds)
+
+    # fractal_dimension on its own, on the same kind of mask extract_features uses
+    mask = img > np.median(img)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fractal_dimension(mask)
+        fractal.append(time.perf_counter() - start)
+
+    # Peak bytes allocated by each stage (tracemalloc), in a run of its own
+    with stage_memory() as peaks:
+        extract_features(data, {}, memory_budget=memory_budget, lean=lean)
+
+    return {
+        "pixels": int(img.size),
+        "total_s": _median(totals),
+        "stages_s": {name: _median(values) for name, values in sorted(stages.items())},
+        "fractal_dimension_s": _median(fractal),
+        "stage_peak_mb": {name: size / 2**20 for name, size in sorted(peaks.items())},
+        "png_bytes": len(data),
+        "peak_rss_mb": peak_rss_mb(img, memory_budget, lean, data),
+    }
+
+def bench_extraction(sizes, repeat, tile_budget=None, log=print):
+    """
+    Default settings and lean mode per size; with tile_budget (bytes), also
+    tiled mode wherever that budget tiles
+    """
+    results = {}
+    for shape in sizes:
+        key = f"{shape[0]}x{shape[1]}"
+        img = tumor_image(shape)
+        results[key] = bench_image(img, repeat)
+        log(f"  extract {key:<10} total {results[key]['total_s'] * 1e3:9.1f} ms  "
+            f"peak RSS +{results[key]['peak_rss_mb']:.0f} MiB")
+
+        lean = bench_image(img, repeat, lean=True)
+        results[key]["lean"] = {k: lean[k] for k in ("total_s", "stage_peak_mb", "peak_rss_mb")}
+        log(f"  lean    {key:<10} total {lean['total_s'] * 1e3:9.1f} ms  "
+            f"peak RSS +{lean['peak_rss_mb']:.0f} MiB")
+
+        if tile_budget and needs_tiling(shape, tile_budget):
+            tiled = bench_image(img, repeat, memory_budget=tile_budget)
+            results[key]["tiled"] = {"memory_budget_mb": tile_budget / 2**20,
+                                     **{k: tiled[k] for k in ("total_s", "peak_rss_mb")}}
+            log(f"  tiled   {key:<10} total {tiled['total_s'] * 1e3:9.1f} ms  "
+                f"peak RSS +{tiled['peak_rss_mb']:.0f} MiB")
+    return results
+
+def _strip_image(shape, seed=0):
+    """Dark noise with one bright run along the long side, for shapes too thin for tumor_image"""
+    img = (np.random.default_rng(seed).random(shape) * 60).astype(np.uint8)
+    long_side = int(np.argmax(shape))
+    index = [slice(None), slice(None)]
+    index[long_side] = slice(shape[long_side] // 3, shape[long_side] // 2)
+    img[tuple(index)] = 220
+    return img
+
+def tiled_parity(shapes=TILED_PARITY_SHAPES, log=print):
+    """{shape: whether tiled extraction matches whole-image extraction (or fails the same way)}"""
+    results = {}
+    for shape in shapes:
+        img = tumor_image(shape) if min(shape) >= 64 else _strip_image(shape)
+        outputs = []
+        for budget in (0, TILED_PARITY_BUDGET):
+            try:
+                outputs.append(extract_features(img, memory_budget=budget))
+            except ValueError as e:
+                outputs.append(str(e))
+        whole, tiled = outputs
+        if isinstance(whole, dict) and isinstance(tiled, dict):
+            same = all(np.isclose(whole[k], tiled[k], rtol=1e-9, equal_nan=True) for k in whole)
+        else:
+            same = whole == tiled
+        same &= needs_tiling(shape, TILED_PARITY_BUDGET)
+        key = f"{shape[0]}x{shape[1]}"
+        results[key] = bool(same)
+        log(f"  tiled parity {key:<12} {'OK' if same else 'FAIL'}")
+    return results
@@ -0,0 +1,54 @@
+"""Synthetic tumor-like grayscale images for benchmarking"""
+import cv2
+import numpy as np
+
+# Square test sizes up to a full-field mammogram (4096 x 3328)
+SIZES = [(256, 256), (512, 512), (1024, 1024), (2048, 2048), (4096, 3328)]
+
+
+def tumor_image(shape, seed=0, n_speckles=None):
+    """
+    Dark, smoothly varying tissue background with one bright lobulated mass
+    and scattered small bright speckles (so segmentation has noise to remove).
+    """
+    h, w = shape
+    rng = np.random.default_rng(seed)
+
+    # Low-frequency background: upsampled coarse noise
+    coarse = rng.normal(60, 15, (max(h // 64, 4), max(w // 64, 4))).astype(np.float32)
+    img = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+    img += rng.normal(0, 8, (h, w)).astype(np.float32)
+
+    # Lobulated mass: a polygon whose radius wobbles around the center
+    cy, cx = h * rng.uniform(0.4, 0.6), w * rng.uniform(0.4, 0.6)
+    base = min(h, w) * 0.12
+    angles = np.linspace(0, 2 * np.pi, 90, endpoint=False)
+    radius = base * (1 + 0.25 * np.sin(5 * angles + rng.uniform(0, 6)) + 0.08 * rng.normal(size=angles.size))
+    points = np.stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)], axis=1)
+    mass = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mass, [points.astype(np.int32)], 1)
+    img[mass > 0] += 110 + rng.normal(0, 12, int(mass.sum())).astype(np.float32)
+
+    # Speckles: many small bright dots, mostly under the small-object threshold
+    if n_speckles is None:
+        n_speckles = h * w // 4000
+    ys, xs = rng.integers(0, h, n_speckles), rng.integers(0, w, n_speckles)
+    for y, x, r in zip(ys, xs, rng.integers(1, 5, n_speckles)):
+        cv2.circle(img, (int(x), int(y)), int(r), 200, -1)
+
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def encode_png(img):
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def blob_image(shape, n_blobs, seed=0):
+    """A tumor image plus n_blobs bright nuclei-sized blobs that survive small-object removal"""
+    h, w = shape
+    rng = np.random.default_rng(seed)
+    img = tumor_image(shape, seed=seed, n_speckles=0)
+    ys, xs = rng.integers(0, h, n_blobs), rng.integers(0, w, n_blobs)
+    for y, x, r in zip(ys, xs, rng.integers(5, 9, n_blobs)):
+        cv2.circle(img, (int(x), int(y)), int(r), int(rng.integers(180, 255)), -1)
+    return img
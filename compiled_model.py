@@ -0,0 +1,316 @@
+"""
+Compiled, NumPy-only inference for the soft-voting classifier.
+
+The pickled VotingClassifier (RandomForest + AdaBoost + XGBoost) is exported
+once into flat node arrays. Every tree of every sub-estimator lives in the same
+table, so one vectorized traversal gives the leaf of each (row, tree) pair, and
+label and probability come out of a single pass with no sklearn calls.
+
+Usage:
+    engine = compile_voting_classifier(joblib.load("model/voting_classifier_model.pkl"))
+    labels, proba = engine.predict_with_proba(X)
+"""
+import json
+import numpy as np
+
+# Rows are traversed in chunks to bound the (rows x trees) node-index buffer
+CHUNK_ROWS = 1024
+
+
+# ======================
+# Threshold helpers
+# ======================
+def _le_threshold(thresholds):
+    """float32 thresholds t32 so that `x32 <= t32` matches `float64(x32) <= t` (sklearn)"""
+    t64 = np.asarray(thresholds, dtype=np.float64)
+    t32 = t64.astype(np.float32)
+    too_high = t32.astype(np.float64) > t64
+    t32[too_high] = np.nextafter(t32[too_high], np.float32(-np.inf))
+    return t32
+
+def _lt_threshold(thresholds):
+    """float32 thresholds t32 so that `x32 <= t32` matches `x32 < t` (XGBoost)"""
+    t = np.asarray(thresholds, dtype=np.float32)
+    return np.nextafter(t, np.float32(-np.inf))
+
+
+# ======================
+# Tree exporters
+# ======================
+def _export_sklearn_tree(estimator):
+    """Return node arrays of a fitted sklearn decision tree plus normalized leaf probabilities"""
+    tree = estimator.tree_
+    left = tree.children_left.astype(np.int32)
+    right = tree.children_right.astype(np.int32)
+    is_leaf = left == -1
+
+    missing_left = getattr(tree, "missing_go_to_left", None)
+    if missing_left is None:
+        missing_left = np.zeros(tree.node_count, dtype=bool)
+
+    proba = tree.value[:, 0, :].astype(np.float64)
+    normalizer = proba.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0] = 1.0
+    proba = proba / normalizer
+
+    return {
+        "feature": np.where(is_leaf, 0, tree.feature).astype(np.int32),
+        "threshold": _le_threshold(tree.threshold),
+        "left": left,
+        "right": right,
+        "missing_left": np.asarray(missing_left, dtype=bool),
+        "is_leaf": is_leaf,
+        "depth": int(tree.max_depth),
+        "leaf": proba,
+    }
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def _export_xgb_tree(tree):
+    """Return node arrays of one tree from an XGBoost JSON model dump"""
+    left = np.asarray(tree["left_children"], dtype=np.int32)
+    right = np.asarray(tree["right_children"], dtype=np.int32)
+    is_leaf = left == -1
+    conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+
+    return {
+        "feature": np.where(is_leaf, 0, tree["split_indices"]).astype(np.int32),
+        "threshold": _lt_threshold(conditions),
+        "left": left,
+        "right": right,
+        "missing_left": np.asarray(tree["default_left"], dtype=bool),
+        "is_leaf": is_leaf,
+        "depth": _tree_depth(left, right),
+        # Leaf nodes store their margin in split_conditions
+        "leaf": conditions.astype(np.float64)[:, None],
+    }
+
+
+# ======================
+# Estimator exporters
+# ======================
+def _samme_r_leaf(proba, n_classes):
+    """Per-leaf SAMME.R contribution (same as sklearn's _samme_proba)"""
+    proba = np.clip(proba, np.finfo(proba.dtype).eps, None)
+    log_proba = np.log(proba)
+    return (n_classes - 1) * (log_proba - log_proba.mean(axis=1, keepdims=True))
+
+def _export_random_forest(estimator):
+    trees = [_export_sklearn_tree(t) for t in estimator.estimators_]
+    return trees, {"kind": "mean", "n_classes": int(estimator.n_classes_)}
+
+def _export_adaboost(estimator):
+    n_classes = int(estimator.n_classes_)
+    algorithm = getattr(estimator, "algorithm", "SAMME")
+    weights = np.asarray(estimator.estimator_weights_[:len(estimator.estimators_)], dtype=np.float64)
+
+    trees = []
+    for tree_estimator, weight in zip(estimator.estimators_, weights):
+        tree = _export_sklearn_tree(tree_estimator)
+        if algorithm == "SAMME.R":
+            tree["leaf"] = _samme_r_leaf(tree["leaf"], n_classes)
+        else:
+            # Discrete SAMME: +w for the voted class, -w/(K-1) for the others
+            voted = tree["leaf"].argmax(axis=1)
+            leaf = np.full(tree["leaf"].shape, -weight / (n_classes - 1))
+            leaf[np.arange(len(leaf)), voted] = weight
+            tree["leaf"] = leaf
+        trees.append(tree)
+
+    return trees, {"kind": "adaboost", "n_classes": n_classes, "weight_sum": float(weights.sum())}
+
+def _export_xgboost(estimator):
+    booster = estimator.get_booster()
+    dump = json.loads(booster.save_raw("json"))["learner"]
+
+    objective = dump["objective"]["name"]
+    if objective != "binary:logistic":
+        raise NotImplementedError(f"Unsupported XGBoost objective: {objective}")
+    model = dump["gradient_booster"]
+    if model["name"] != "gbtree":
+        raise NotImplementedError(f"Unsupported XGBoost booster: {model['name']}")
+
+    trees = model["model"]["trees"]
+    if any(tree["categories"] for tree in trees):
+        raise NotImplementedError("Categorical XGBoost splits are not supported")
+
+    best_iteration = getattr(booster, "best_iteration", None)
+    if best_iteration is not None:
+        per_round = int(model["model"]["gbtree_model_param"]["num_parallel_tree"])
+        trees = trees[:(best_iteration + 1) * per_round]
+
+    base_score = float(dump["learner_model_param"]["base_score"].strip("[]"))
+    base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+    return [_export_xgb_tree(t) for t in trees], {"kind": "logistic", "n_classes": 2, "base_margin": base_margin}
+
+def _export_estimator(estimator):
+    name = type(estimator).__name__
+    if name == "RandomForestClassifier" or name == "ExtraTreesClassifier":
+        return _export_random_forest(estimator)
+    if name == "AdaBoostClassifier":
+        return _export_adaboost(estimator)
+    if name == "XGBClassifier":
+        return _export_xgboost(estimator)
+    raise NotImplementedError(f"Cannot compile estimator of type {name}")
+
+
+# ======================
+# Compiled predictor
+# ======================
+class CompiledVotingClassifier:
+    """Flat NumPy predictor equivalent to a fitted soft-voting VotingClassifier"""
+
+    def __init__(self, classes, nodes, groups, vote_weights):
+        self.classes_ = np.asarray(classes)
+        self.nodes = nodes
+        self.groups = groups
+        self.vote_weights = np.asarray(vote_weights, dtype=np.float64)
+        self.n_trees = len(nodes["roots"])
+
+        # Interleaved (left, right) children: child of node n is children[2n + go_right]
+        self._children = np.column_stack([nodes["left"], nodes["right"]]).ravel()
+
+        # Trees are traversed deepest first so shallow trees drop out of the loop
+        # once they reach their leaves (AdaBoost stumps finish after one step)
+        depth = np.asarray(nodes["tree_depth"])
+        self._order = np.argsort(-depth, kind="stable")
+        self._position = np.argsort(self._order)
+        self._roots = np.asarray(nodes["roots"])[self._order]
+        self._active = [int((depth > d).sum()) for d in range(int(depth.max(initial=0)))]
+
+    # ----- traversal -----
+    def apply(self, X):
+        """Return the global leaf node index of every (row, tree) pair"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        feature, threshold = self.nodes["feature"], self.nodes["threshold"]
+        missing_left = self.nodes["missing_left"]
+        has_missing = bool(np.isnan(X).any())
+
+        flat_x = X.ravel()
+        row_offset = (np.arange(X.shape[0]) * X.shape[1])[:, None]
+        node = np.repeat(self._roots[None, :], X.shape[0], axis=0)
+        for n_active in self._active:
+            active = node[:, :n_active]
+            x = flat_x.take(row_offset + feature.take(active))
+            go_right = ~(x <= threshold.take(active))
+            if has_missing:
+                go_right &= ~(np.isnan(x) & missing_left.take(active))
+            node[:, :n_active] = self._children.take(2 * active + go_right)
+        return node[:, self._position]
+
+    def _group_proba(self, group, leaves):
+        t0, t1 = group["trees"]
+        index = leaves[:, t0:t1] - group["node_offset"]
+        leaf = group["leaf"]
+        # One 1D gather per class column is much cheaper than a 3D fancy index
+        score = np.column_stack([leaf[:, k].take(index).sum(axis=1) for k in range(leaf.shape[1])])
+
+        if group["kind"] == "mean":
+            return score / (t1 - t0)
+
+        if group["kind"] == "logistic":
+            p1 = 1.0 / (1.0 + np.exp(-(score[:, 0] + group["base_margin"])))
+            return np.column_stack([1.0 - p1, p1])
+
+        # AdaBoost: normalized decision then softmax (binary decision is folded into +-d/2)
+        n_classes = group["n_classes"]
+        score = score / group["weight_sum"]
+        if n_classes == 2:
+            decision = score[:, 1] - score[:, 0]
+            score = np.column_stack([-decision, decision]) / 2
+        else:
+            score = score / (n_classes - 1)
+        score = score - score.max(axis=1, keepdims=True)
+        exp = np.exp(score)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    # ----- public API -----
+    def predict_proba(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        out = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            leaves = self.apply(chunk)
+            probas = [self._group_proba(g, leaves) for g in self.groups]
+            out[start:start + CHUNK_ROWS] = np.average(probas, axis=0, weights=self.vote_weights)
+        return out
+
+    def predict_with_proba(self, X):
+        """Return (labels, probabilities) from one traversal"""
+        proba = self.predict_proba(X)
+        return self.classes_[proba.argmax(axis=1)], proba
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    # ----- persistence -----
+    def save(self, path):
+        arrays = {f"nodes_{k}": np.asarray(v) for k, v in self.nodes.items()}
+        meta = []
+        for i, group in enumerate(self.groups):
+            arrays[f"group{i}_leaf"] = group["leaf"]
+            meta.append({k: v for k, v in group.items() if k != "leaf"})
+        arrays["classes"] = self.classes_
+        arrays["vote_weights"] = self.vote_weights
+        arrays["groups"] = np.array(json.dumps(meta))
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            nodes = {k[len("nodes_"):]: data[k] for k in data.files if k.startswith("nodes_")}
+            groups = json.loads(str(data["groups"]))
+            for i, group in enumerate(groups):
+                group["leaf"] = data[f"group{i}_leaf"]
+                group["trees"] = tuple(group["trees"])
+            return cls(data["classes"], nodes, groups, data["vote_weights"])
+
+
+def compile_voting_classifier(model):
+    """Export a fitted soft-voting VotingClassifier into a CompiledVotingClassifier"""
+    if type(model).__name__ != "VotingClassifier" or model.voting != "soft":
+        raise NotImplementedError("Only soft-voting VotingClassifier models can be compiled")
+
+    node_arrays = {k: [] for k in ("feature", "threshold", "left", "right", "missing_left")}
+    roots, depths, groups, offset = [], [], [], 0
+
+    for estimator in model.estimators_:
+        trees, group = _export_estimator(estimator)
+        group["trees"] = (len(roots), len(roots) + len(trees))
+        group["node_offset"] = offset
+
+        for tree in trees:
+            n = len(tree["left"])
+            node_ids = np.arange(offset, offset + n, dtype=np.int32)
+            # Leaves loop onto themselves so rows that finish early stay put
+            left = np.where(tree["is_leaf"], node_ids, tree["left"] + offset)
+            right = np.where(tree["is_leaf"], node_ids, tree["right"] + offset)
+            threshold = np.where(tree["is_leaf"], np.float32(np.inf), tree["threshold"])
+
+            node_arrays["feature"].append(tree["feature"])
+            node_arrays["threshold"].append(threshold.astype(np.float32))
+            node_arrays["left"].append(left.astype(np.int32))
+            node_arrays["right"].append(right.astype(np.int32))
+            node_arrays["missing_left"].append(tree["missing_left"])
+            roots.append(offset)
+            depths.append(tree["depth"])
+            offset += n
+
+        group["leaf"] = np.concatenate([t["leaf"] for t in trees])
+        groups.append(group)
+
+    nodes = {k: np.concatenate(v) for k, v in node_arrays.items()}
+    nodes["roots"] = np.asarray(roots, dtype=np.int32)
+    nodes["tree_depth"] = np.asarray(depths, dtype=np.int32)
+
+    weights = [1.0] * len(groups)
+    if model.weights is not None:
+        weights = [w for (_, est), w in zip(model.estimators, model.weights) if est != "drop"]
+    return CompiledVotingClassifier(model.classes_, nodes, groups, weights)
@@ -0,0 +1,93 @@
+"""
+Process pool for CPU-heavy image feature extraction.
+
+Jobs run in separate processes so a large image never blocks the event loop.
+The number of jobs admitted at once (running + waiting) is bounded; callers
+get a 503 when the queue is full and a 504 when a job exceeds its timeout.
+A worker that dies (OOM kill, crash in a native decoder) breaks the whole
+executor; it is replaced and the jobs it took down get a 503.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+
+def _ping():
+    return True
+
+
+class ExtractionPool:
+    def __init__(self, workers, queue_size, timeout, initializer=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.initializer = initializer
+        self.executor = None
+        self._executor_lock = threading.Lock()
+        # Jobs admitted and not finished yet (running or queued)
+        self.pending = 0
+        self.restarts = 0
+
+    def _new_executor(self):
+        # spawn: never fork a process that is already running an event loop
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+        )
+
+    async def start(self, prewarm=True):
+        """Create the executor; with prewarm, spawn every worker and run its initializer now"""
+        self.executor = self._new_executor()
+
+        if not prewarm:
+            # Workers are spawned on demand by the first jobs
+            return
+
+        # One concurrent job per worker forces every process to start now
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _replace_broken(self, executor):
+        """Swap in a fresh executor for a broken one, once however many jobs saw it break"""
+        with self._executor_lock:
+            if self.executor is not executor:
+                return
+            self.executor = self._new_executor()
+            self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def run(self, fn, *args):
+        if self.pending >= self.workers + self.queue_size:
+            raise HTTPException(status_code=503, detail="Image processing queue is full, retry later")
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            future = loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise HTTPException(status_code=503, detail="Image processing worker crashed, retry later")
+        # The slot is only freed once the worker is actually done, even after a timeout
+        self.pending += 1
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Image processing exceeded {self.timeout}s")
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise HTTPException(status_code=503, detail="Image processing worker crashed, retry later")
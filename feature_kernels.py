@@ -0,0 +1,367 @@
+"""
+Vectorized NumPy kernels for the image features of extract_features.
+
+Each kernel computes one feature from just the pixels it needs, without the
+general-purpose scikit-image machinery behind it.
+"""
+import threading
+
+import numpy as np
+
+
+# ======================
+# Texture (GLCM contrast)
+# ======================
+def quantize(img, levels):
+    """Map 8-bit gray values 0..255 onto 0..levels-1"""
+    if levels == 256:
+        return img
+    if levels & (levels - 1) == 0:
+        return img >> (9 - levels.bit_length())
+    return ((img.astype(np.uint16) * levels) >> 8).astype(np.uint8)
+
+def contrast_histogram(img, levels=256, mask=None):
+    """
+    Histogram of |a - b| over horizontally adjacent pixel pairs (distance 1,
+    angle 0). With a mask, only pairs whose two pixels are inside it count.
+    """
+    import cv2
+    if not 2 <= levels <= 256:
+        raise ValueError(f"levels must be between 2 and 256, got {levels}")
+    hist = np.zeros(levels, dtype=np.int64)
+    if img.shape[1] < 2:
+        return hist
+
+    q = quantize(img, levels)
+    diff = cv2.absdiff(q[:, 1:], q[:, :-1])
+    pairs = None if mask is None else (mask[:, 1:] & mask[:, :-1]).view(np.uint8)
+    # calcHist counts in float32 (exact up to 2**24 per bin), so large images go in bands
+    band = max(1, (1 << 23) // diff.shape[1])
+    for start in range(0, diff.shape[0], band):
+        band_pairs = None if pairs is None else pairs[start:start + band]
+        counts = cv2.calcHist([diff[start:start + band]], [0], band_pairs, [levels], [0, levels])
+        hist += counts.ravel().astype(np.int64)
+    return hist
+
+def contrast_from_histogram(hist, levels=256):
+    """GLCM contrast from a difference histogram, on the 0..255 gray scale"""
+    total = hist.sum()
+    if total == 0:
+        return 0.0
+    d = np.arange(len(hist), dtype=np.float64)
+    # (i - j)^2 in quantized units, scaled back so every level count is comparable
+    return float((hist * d * d).sum() / total) * (256 / levels) ** 2
+
+def glcm_contrast(img, levels=256, mask=None):
+    """
+    Same value as graycoprops(graycomatrix(img, [1], [0], levels,
+    symmetric=True, normed=True), 'contrast') for 256 levels.
+
+    Contrast weights every co-occurring pair by (i - j)^2, so the
+    levels x levels matrix collapses into one bincount over |i - j|.
+    """
+    return contrast_from_histogram(contrast_histogram(img, levels, mask), levels)
+
+
+# ======================
+# Fractal dimension (box counting)
+# ======================
+def _or_reduce(mask):
+    """2x2 OR-reduction; an odd last row/column is padded with empty cells"""
+    h, w = mask.shape
+    if h % 2 or w % 2:
+        mask = np.pad(mask, ((0, h % 2), (0, w % 2)))
+    rows = mask[0::2] | mask[1::2]
+    return rows[:, 0::2] | rows[:, 1::2]
+
+def occupancy_pyramid(mask, n_levels):
+    """
+    Number of occupied boxes for box sizes 2, 4, ..., 2**n_levels, and the
+    top level of the pyramid (one cell per 2**n_levels box).
+
+    Level k of the occupancy pyramid is the 2x2 OR-reduction of level k-1, so
+    each of its cells covers the same pixels as a 2**k box aligned at the
+    origin (boxes at the edges are partial), and all scales come from one pass
+    over boolean arrays that shrink by 4x per level.
+    """
+    level = mask if mask.dtype == bool else mask > 0
+    counts = []
+    for _ in range(n_levels):
+        level = _or_reduce(level)
+        counts.append(int(np.count_nonzero(level)))
+    return counts, level
+
+def box_counts(mask, n_levels):
+    """Number of occupied boxes for box sizes 2, 4, ..., 2**n_levels"""
+    return occupancy_pyramid(mask, n_levels)[0]
+
+
+# ======================
+# Regions
+# ======================
+# Pixels per band when a full-image pass would otherwise need a full-size temporary
+_BAND_PIXELS = 1 << 20
+
+def _row_bands(shape):
+    rows = max(1, _BAND_PIXELS // max(shape[1], 1))
+    for start in range(0, shape[0], rows):
+        yield slice(start, start + rows)
+
+def label_sizes(labeled, n_labels):
+    """Pixel count of every label 0..n_labels, without an intp copy of the whole label image"""
+    sizes = np.zeros(n_labels + 1, dtype=np.int64)
+    for band in _row_bands(labeled.shape):
+        sizes += np.bincount(labeled[band].ravel(), minlength=n_labels + 1)
+    return sizes
+
+def largest_component(labeled, n_labels=None):
+    """
+    (bounding-box slices, boolean mask within them) of the largest labeled
+    component, or None when there is none; ties go to the lowest label.
+    Component sizes come from a banded bincount over the label image, skipped
+    when n_labels says there is a single component.
+    """
+    if n_labels is None:
+        n_labels = int(labeled.max())
+    if n_labels == 0:
+        return None
+    if n_labels == 1:
+        label = 1
+    else:
+        sizes = label_sizes(labeled, n_labels)
+        sizes[0] = 0  # background
+        label = int(np.argmax(sizes))
+    # Rows and columns the component touches, one band at a time
+    rows = np.zeros(labeled.shape[0], dtype=bool)
+    cols = np.zeros(labeled.shape[1], dtype=bool)
+    for band in _row_bands(labeled.shape):
+        mask = labeled[band] == label
+        rows[band] = mask.any(axis=1)
+        cols |= mask.any(axis=0)
+    rows, cols = np.flatnonzero(rows), np.flatnonzero(cols)
+    box = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    return box, labeled[box] == label
+
+
+# ======================
+# Lean segmentation
+# ======================
+class WorkBuffers(threading.local):
+    """
+    Scratch arrays kept per thread and reused from image to image: a boolean
+    mask and int32 labels, grown to the largest image seen so far.
+    """
+
+    def __init__(self):
+        self.mask = np.empty(0, dtype=bool)
+        self.labels = np.empty(0, dtype=np.int32)
+
+    def get(self, shape):
+        n = shape[0] * shape[1]
+        if self.mask.size < n:
+            # Drop the old pair first so both sizes are never held at once
+            self.mask = self.labels = None
+            self.mask = np.empty(n, dtype=bool)
+            self.labels = np.empty(n, dtype=np.int32)
+        return self.mask[:n].reshape(shape), self.labels[:n].reshape(shape)
+
+def otsu_threshold(img, rows=None):
+    """threshold_otsu(img) of an 8-bit image from a histogram accumulated `rows` rows at a time"""
+    import cv2
+    from skimage.filters import threshold_otsu
+    bands = _row_bands(img.shape) if rows is None else (slice(r, r + rows) for r in range(0, img.shape[0], rows))
+    hist = np.zeros(256, dtype=np.int64)
+    for band in bands:
+        hist += cv2.calcHist([img[band]], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    values = np.flatnonzero(hist)
+    lo, hi = int(values[0]), int(values[-1])
+    if lo == hi:
+        # threshold_otsu returns the value itself for a uniform image
+        return lo
+    return threshold_otsu(hist=(hist[lo:hi + 1], np.arange(lo, hi + 1)))
+
+def kept_objects(sizes, min_size):
+    """
+    Which object sizes morphology.remove_small_objects(ar, min_size) keeps;
+    since scikit-image 0.26 objects of exactly min_size are dropped as well
+    """
+    import skimage
+    major, minor = (int(part) for part in skimage.__version__.split(".")[:2])
+    return sizes > min_size if (major, minor) >= (0, 26) else sizes >= min_size
+
+def segment_into(img, thresh, min_size, mask, labels):
+    """
+    img > thresh without its small 4-connected objects (as
+    morphology.remove_small_objects), written into mask. labels is scratch
+    space of the same shape.
+    """
+    from scipy import ndimage
+    np.greater(img, thresh, out=mask)
+    n = ndimage.label(mask, output=labels)
+    keep = kept_objects(label_sizes(labels, n), min_size)
+    keep[0] = False  # background
+    # np.take widens int32 indices to intp; a band at a time keeps that copy small
+    for band in _row_bands(labels.shape):
+        np.take(keep, labels[band], out=mask[band])
+    return mask
+
+def label_into(mask, labels):
+    """8-connected labels of mask (as measure.label) written into labels; returns the label count"""
+    from scipy import ndimage
+    return ndimage.label(mask, structure=np.ones((3, 3), dtype=bool), output=labels)
+
+
+# ======================
+# Per-region features
+# ======================
+# Weights of the border configurations in skimage.measure.perimeter (4-neighbourhood)
+_PERIMETER_WEIGHTS = np.zeros(50)
+_PERIMETER_WEIGHTS[[5, 7, 15, 17, 25, 27]] = 1
+_PERIMETER_WEIGHTS[[21, 33]] = np.sqrt(2)
+_PERIMETER_WEIGHTS[[13, 23]] = (1 + np.sqrt(2)) / 2
+# Neighbour offsets and their codes in the perimeter convolution kernel
+_PERIMETER_NEIGHBOURS = [((-1, 0), 2), ((1, 0), 2), ((0, -1), 2), ((0, 1), 2),
+                         ((-1, -1), 10), ((-1, 1), 10), ((1, -1), 10), ((1, 1), 10)]
+
+
+# region_box_dimension packs (label, row, column) into one int64 key, 21 bits per coordinate
+_KEY_BITS = 21
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+
+class LabeledRegions:
+    """Foreground pixels of a label image (in raster order), shared by the per-region kernels"""
+
+    def __init__(self, labeled, n_labels):
+        self.labeled = labeled
+        self.n_labels = n_labels
+        self.rows, self.cols = np.nonzero(labeled)
+        self.labels = labeled[self.rows, self.cols]
+        # Flat positions in the label image padded by one background pixel
+        self._stride = labeled.shape[1] + 2
+        self._flat = (self.rows + 1) * self._stride + self.cols + 1
+
+    def sum(self, weights=None):
+        """Per-region sum of weights (pixel count without), indexed by label - 1"""
+        return np.bincount(self.labels, weights=weights, minlength=self.n_labels + 1)[1:]
+
+    def neighbours(self, dy, dx, keep=None):
+        """
+        Label at (row + dy, col + dx) of every foreground pixel, 0 outside the
+        image. With a boolean keep, only the kept pixels are used, both as
+        centres and as neighbours.
+        """
+        if keep is None:
+            padded = getattr(self, "_padded", None)
+            if padded is None:
+                padded = self._padded = np.pad(self.labeled, 1).ravel()
+            return padded[self._flat + dy * self._stride + dx]
+        padded = np.zeros((self.labeled.shape[0] + 2) * self._stride, dtype=self.labels.dtype)
+        flat = self._flat[keep]
+        padded[flat] = self.labels[keep]
+        return padded[flat + dy * self._stride + dx]
+
+def region_shapes(regions, img):
+    """
+    Area, mean intensity, bounding boxes and second-moment shape measures of
+    every region at once (indexed by label - 1), matching regionprops.
+    """
+    n_labels, labels, rows, cols = regions.n_labels, regions.labels, regions.rows, regions.cols
+    area = regions.sum().astype(np.float64)
+    mean_intensity = regions.sum(img[rows, cols]) / area
+
+    # Central second moments around each region's centroid
+    dr = rows - (regions.sum(rows) / area)[labels - 1]
+    dc = cols - (regions.sum(cols) / area)[labels - 1]
+    a = regions.sum(dr * dr) / area
+    c = regions.sum(dc * dc) / area
+    b = regions.sum(dr * dc) / area
+    spread = np.sqrt(((a - c) / 2) ** 2 + b * b)
+    l1 = np.maximum((a + c) / 2 + spread, 0)
+    l2 = np.maximum((a + c) / 2 - spread, 0)
+
+    # Bounding boxes: first row, first column, height, width
+    first_row = np.full(n_labels, np.iinfo(np.int64).max)
+    first_col = first_row.copy()
+    last_row = np.zeros(n_labels, dtype=np.int64)
+    last_col = last_row.copy()
+    np.minimum.at(first_row, labels - 1, rows)
+    np.minimum.at(first_col, labels - 1, cols)
+    np.maximum.at(last_row, labels - 1, rows)
+    np.maximum.at(last_col, labels - 1, cols)
+    boxes = np.stack([first_row, first_col, last_row - first_row + 1, last_col - first_col + 1], axis=1)
+    return {
+        "area": area,
+        "mean_intensity": mean_intensity,
+        "boxes": boxes,
+        "extent": area / (boxes[:, 2] * boxes[:, 3]),
+        "eccentricity": np.sqrt(1 - np.divide(l2, l1, out=np.ones(n_labels), where=l1 > 0)),
+        "major_axis_length": 4 * np.sqrt(l1),
+        "minor_axis_length": 4 * np.sqrt(l2),
+    }
+
+def region_perimeters(regions):
+    """skimage.measure.perimeter of every region at once, indexed by label - 1"""
+    labels = regions.labels
+    # Border pixels: a 4-neighbour belongs to another region or the background
+    border = np.zeros(labels.size, dtype=bool)
+    for (dy, dx), _ in _PERIMETER_NEIGHBOURS[:4]:
+        border |= regions.neighbours(dy, dx) != labels
+
+    # Convolution code of each border pixel, counting only border pixels of its own region
+    border_labels = labels[border]
+    code = np.ones(border_labels.size, dtype=np.uint8)
+    for (dy, dx), weight in _PERIMETER_NEIGHBOURS:
+        code += np.uint8(weight) * (regions.neighbours(dy, dx, keep=border) == border_labels)
+    return np.bincount(border_labels, weights=_PERIMETER_WEIGHTS[code], minlength=regions.n_labels + 1)[1:]
+
+def region_contrast(regions, img, levels=256):
+    """glcm_contrast of every region over its own pixel pairs (the 'mask' ROI), indexed by label - 1"""
+    q = quantize(img, levels)
+    labels, rows, cols = regions.labels, regions.rows, regions.cols
+    # Pairs of a pixel and its right-hand neighbour in the same region
+    same = regions.neighbours(0, 1) == labels
+    rows, cols = rows[same], cols[same]
+    diff = q[rows, cols + 1].astype(np.float64) - q[rows, cols]
+    sums = np.bincount(labels[same], weights=diff * diff, minlength=regions.n_labels + 1)[1:]
+    pairs = np.bincount(labels[same], minlength=regions.n_labels + 1)[1:]
+    return np.divide(sums, pairs, out=np.zeros(regions.n_labels), where=pairs > 0) * (256 / levels) ** 2
+
+def region_box_dimension(regions, boxes):
+    """
+    Box-counting dimension of every region's own mask, with boxes aligned to
+    its bounding box as fractal_dimension(region.image) would place them.
+    boxes holds (first row, first column, height, width) per region.
+    """
+    n_labels = regions.n_labels
+    labels = regions.labels.astype(np.int64)
+    rows = regions.rows - boxes[labels - 1, 0]
+    cols = regions.cols - boxes[labels - 1, 1]
+
+    # Box sizes 2, 4, ... below each region's shorter side
+    n_levels = np.floor(np.log2(np.maximum(boxes[:, 2:].min(axis=1), 1))).astype(int) - 1
+    max_levels = max(int(n_levels.max()), 0)
+    counts = np.zeros((n_labels, max_levels))
+    keys = (labels << 2 * _KEY_BITS) | (rows << _KEY_BITS) | cols
+    for k in range(max_levels):
+        # Occupied boxes of the next size: distinct (label, row // 2, col // 2) of this level's boxes
+        keys = np.unique(keys >> 2 * _KEY_BITS << 2 * _KEY_BITS
+                         | (keys >> _KEY_BITS + 1 & _KEY_MASK) << _KEY_BITS
+                         | (keys & _KEY_MASK) >> 1)
+        counts[:, k] = np.bincount(keys >> 2 * _KEY_BITS, minlength=n_labels + 1)[1:]
+
+    # Least-squares slope of log(count) against log(size) over each region's own levels
+    valid = np.arange(max_levels) < n_levels[:, None]
+    x = np.where(valid, np.log(2.0 ** np.arange(1, max_levels + 1)), 0.0)
+    y = np.where(valid, np.log(np.where(valid, counts, 1)), 0.0)
+    m = valid.sum(axis=1)
+    sx, sy, sxx, sxy = x.sum(axis=1), y.sum(axis=1), (x * x).sum(axis=1), (x * y).sum(axis=1)
+    denominator = m * sxx - sx * sx
+    slope = np.divide(m * sxy - sx * sy, denominator, out=np.zeros(n_labels), where=m >= 2)
+    return 0.0 - slope
+
+def summarize(values):
+    """Mean, standard error and worst (mean of the three largest) of per-region values"""
+    n = len(values)
+    se = values.std(ddof=1) / np.sqrt(n) if n > 1 else 0.0
+    return float(values.mean()), float(se), float(np.sort(values)[-3:].mean())
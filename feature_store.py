@@ -0,0 +1,245 @@
+"""
+Persistent feature store: extracted feature vectors keyed by image hash.
+
+Vectors live in an append-only float32 matrix on disk (one row per image,
+columns in a fixed order), read through np.memmap. A SQLite index maps each
+key to its row and records how many rows are committed, so readers in any
+number of processes only ever see complete rows. Writers append under a
+file lock. Replacing or deleting a key leaves its old row behind; compact()
+rewrites the matrix with live rows only into a new file generation, and
+readers holding the previous file keep a valid view of it.
+"""
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+DTYPE = np.float32
+
+
+class FeatureStore:
+    def __init__(self, path, columns=None, meta=None):
+        """
+        Open (or create) the store in directory path. columns names the matrix
+        columns; meta describes how the vectors were produced (e.g. extraction
+        settings). Both must match what the store was created with; without
+        columns an existing store is opened with its own layout.
+        """
+        self.path = path
+        if columns is None and not os.path.exists(os.path.join(path, "index.sqlite3")):
+            raise ValueError(f"No feature store in {path}")
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rows_by_row ON rows (row)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._view = None  # (generation, n_rows, memmap)
+
+        with self._writing():
+            stored = self._meta("layout")
+            stored = None if stored is None else json.loads(stored)
+            if columns is None:
+                columns, meta = stored["columns"], stored["meta"]
+            expected = {"columns": list(columns), "meta": meta or {}}
+            if stored is None:
+                self._db.execute("INSERT INTO meta VALUES ('layout', ?), ('generation', '0'), ('rows', '0')",
+                                 (json.dumps(expected),))
+            elif stored != expected:
+                same_columns = stored["columns"] == expected["columns"]
+                what = "settings " + json.dumps(stored["meta"]) if same_columns else "columns"
+                raise ValueError(f"Feature store {path} was built with other {what}; use another directory")
+        self.columns = expected["columns"]
+        self.meta = expected["meta"]
+        self.row_bytes = len(self.columns) * DTYPE().itemsize
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def _data_path(self, generation):
+        return os.path.join(self.path, f"features.{generation}.f32")
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive access for writers in every process"""
+        with self._lock, open(os.path.join(self.path, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ----- reading -----
+    def _state(self):
+        with self._lock:
+            rows = dict(self._db.execute("SELECT name, value FROM meta WHERE name IN ('generation', 'rows')"))
+        return int(rows["generation"]), int(rows["rows"])
+
+    def _matrix_of(self, generation, n_rows):
+        """Read-only view of the first n_rows rows of a generation; FileNotFoundError once it is compacted away"""
+        view = self._view
+        if view is not None and view[:2] == (generation, n_rows):
+            return view[2]
+        if n_rows == 0:
+            data = np.zeros((0, len(self.columns)), dtype=DTYPE)
+        else:
+            data = np.memmap(self._data_path(generation), dtype=DTYPE, mode="r",
+                             shape=(n_rows, len(self.columns)))
+        self._view = (generation, n_rows, data)
+        return data
+
+    def matrix(self):
+        """Read-only (n_rows, n_columns) view of every committed row, including replaced ones"""
+        while True:
+            try:
+                return self._matrix_of(*self._state())
+            except FileNotFoundError:
+                # Another process compacted the store after _state(); read the new generation
+                continue
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def get(self, key):
+        """The stored vector of key as float64, or None"""
+        while True:
+            with self._lock:
+                # Row number and the generation it belongs to from one version of the index
+                self._db.execute("BEGIN")
+                try:
+                    row = self._db.execute("SELECT row FROM rows WHERE key = ?", (key,)).fetchone()
+                    state = dict(self._db.execute(
+                        "SELECT name, value FROM meta WHERE name IN ('generation', 'rows')"))
+                finally:
+                    self._db.execute("COMMIT")
+            if row is None:
+                return None
+            try:
+                matrix = self._matrix_of(int(state["generation"]), int(state["rows"]))
+            except FileNotFoundError:
+                # Compacted between the two reads; look the key up again
+                continue
+            return matrix[row[0]].astype(np.float64)
+
+    def items(self, batch_size=100000):
+        """
+        (keys, vectors) of every live key in row order, batch_size rows at a
+        time, from one consistent snapshot of the store
+        """
+        db = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), isolation_level=None)
+        try:
+            while True:
+                # Reads inside one transaction see a single version of the index
+                db.execute("BEGIN")
+                state = dict(db.execute("SELECT name, value FROM meta WHERE name IN ('generation', 'rows')"))
+                generation, n_rows = int(state["generation"]), int(state["rows"])
+                if n_rows == 0:
+                    return
+                try:
+                    matrix = np.memmap(self._data_path(generation), dtype=DTYPE, mode="r",
+                                       shape=(n_rows, len(self.columns)))
+                    break
+                except FileNotFoundError:
+                    db.execute("ROLLBACK")
+            cursor = db.execute("SELECT key, row FROM rows ORDER BY row")
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                keys, positions = zip(*batch)
+                yield list(keys), matrix[np.array(positions, dtype=np.int64)]
+        finally:
+            db.close()
+
+    # ----- writing -----
+    def put_many(self, keys, vectors):
+        """Store vectors (n, n_columns) under keys, replacing existing entries"""
+        vectors = np.ascontiguousarray(vectors, dtype=DTYPE).reshape(len(keys), len(self.columns))
+        if not len(keys):
+            return
+        with self._writing():
+            generation, n_rows = int(self._meta("generation")), int(self._meta("rows"))
+            with open(self._data_path(generation), "ab") as f:
+                # Rows left by a writer that died before committing are overwritten
+                f.truncate(n_rows * self.row_bytes)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?)",
+                                 zip(keys, range(n_rows, n_rows + len(keys))))
+            self._db.execute("UPDATE meta SET value = ? WHERE name = 'rows'", (str(n_rows + len(keys)),))
+            self._db.execute("COMMIT")
+
+    def put(self, key, vector):
+        self.put_many([key], np.asarray(vector)[None])
+
+    def delete(self, keys):
+        with self._writing():
+            self._db.executemany("DELETE FROM rows WHERE key = ?", ((k,) for k in keys))
+
+    def compact(self):
+        """Rewrite the matrix with live rows only; returns the number of rows dropped"""
+        with self._writing():
+            generation, n_rows = int(self._meta("generation")), int(self._meta("rows"))
+            rows = self._db.execute("SELECT key, row FROM rows ORDER BY row").fetchall()
+            if len(rows) == n_rows:
+                return 0
+            new_path = self._data_path(generation + 1)
+            with open(new_path, "wb") as f:
+                if n_rows:
+                    old = np.memmap(self._data_path(generation), dtype=DTYPE, mode="r",
+                                    shape=(n_rows, len(self.columns)))
+                    positions = np.array([r for _, r in rows], dtype=np.int64)
+                    for start in range(0, len(positions), 100000):
+                        f.write(np.ascontiguousarray(old[positions[start:start + 100000]]).tobytes())
+                    del old
+                f.flush()
+                os.fsync(f.fileno())
+            # Index, row count and generation switch together; readers move over on their next call
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("UPDATE rows SET row = ? WHERE key = ?",
+                                 ((i, key) for i, (key, _) in enumerate(rows)))
+            self._db.execute("UPDATE meta SET value = ? WHERE name = 'rows'", (str(len(rows)),))
+            self._db.execute("UPDATE meta SET value = ? WHERE name = 'generation'", (str(generation + 1),))
+            self._db.execute("COMMIT")
+            for name in os.listdir(self.path):
+                if name.startswith("features.") and name != os.path.basename(new_path):
+                    os.remove(os.path.join(self.path, name))
+            return n_rows - len(rows)
+
+    def stats(self):
+        generation, n_rows = self._state()
+        return {"keys": len(self), "rows": n_rows, "generation": generation,
+                "bytes": n_rows * self.row_bytes, "path": self.path}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(prog="python feature_store.py", description="Inspect or compact a feature store")
+    parser.add_argument("path", help="feature store directory")
+    parser.add_argument("--compact", action="store_true", help="drop rows of replaced and deleted keys")
+    args = parser.parse_args()
+    try:
+        store = FeatureStore(args.path)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.compact:
+        print(f"dropped {store.compact()} rows")
+    print(json.dumps({**store.stats(), "meta": store.meta}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
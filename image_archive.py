@@ -0,0 +1,142 @@
+"""
+Multi-image uploads: multipart bodies with many files and zip/tar archives.
+
+Uploaded files are spooled to disk while the body is received, and archive
+members are only read when their turn comes, so memory holds the images
+being processed rather than the whole upload. stream_results runs a bounded
+number of jobs at once and yields one NDJSON line per image as soon as it
+finishes, in completion order.
+"""
+import asyncio
+import json
+import os
+import tarfile
+import zipfile
+
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartParser
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class DiskSpoolingParser(MultiPartParser):
+    """Multipart parser that moves every uploaded file to disk after its first chunk"""
+    spool_max_size = 64 * 1024
+
+
+def _is_archive(upload):
+    name = (upload.filename or "").lower()
+    if name.endswith(ARCHIVE_SUFFIXES):
+        return True
+    # Archives sent without a telling file name
+    upload.file.seek(0)
+    is_zip = zipfile.is_zipfile(upload.file)
+    upload.file.seek(0)
+    return is_zip
+
+def _skipped(name):
+    """Directories and OS metadata that archive tools add next to the images"""
+    base = os.path.basename(name.rstrip("/"))
+    return name.endswith("/") or base.startswith(".") or "__MACOSX/" in name
+
+def _zip_members(upload, max_bytes):
+    archive = zipfile.ZipFile(upload.file)
+    for info in archive.infolist():
+        if info.is_dir() or _skipped(info.filename):
+            continue
+        if info.file_size > max_bytes:
+            yield info.filename, _too_large(info.file_size, max_bytes)
+        else:
+            yield info.filename, lambda info=info: archive.read(info)
+
+def _tar_members(upload, max_bytes):
+    upload.file.seek(0)
+    # Streaming mode: members are read in order without seeking back
+    archive = tarfile.open(fileobj=upload.file, mode="r|*")
+    for member in archive:
+        if not member.isfile() or _skipped(member.name):
+            continue
+        if member.size > max_bytes:
+            yield member.name, _too_large(member.size, max_bytes)
+        else:
+            data = archive.extractfile(member).read()
+            yield member.name, lambda data=data: data
+
+def _plain_file(upload, max_bytes):
+    size = upload.size
+    if size is None:
+        size = upload.file.seek(0, os.SEEK_END)
+    if size > max_bytes:
+        return _too_large(size, max_bytes)
+
+    def read():
+        upload.file.seek(0)
+        return upload.file.read()
+    return read
+
+def _too_large(size, max_bytes):
+    def fail():
+        raise ValueError(f"Image of {size} bytes exceeds MAX_UPLOAD_BYTES={max_bytes}")
+    return fail
+
+def iter_images(uploads, max_bytes):
+    """
+    (name, read) for every image in the uploads, expanding archives. read()
+    returns the image bytes; it raises ValueError for files and members over
+    max_bytes.
+    """
+    for upload in uploads:
+        if not _is_archive(upload):
+            yield upload.filename, _plain_file(upload, max_bytes)
+        elif zipfile.is_zipfile(upload.file):
+            yield from _zip_members(upload, max_bytes)
+        else:
+            yield from _tar_members(upload, max_bytes)
+
+
+async def stream_results(images, predict, concurrency):
+    """
+    NDJSON lines for images, an iterator of (name, read). predict(data) is
+    awaited with at most `concurrency` images in flight. Each line is the
+    prediction result (or an error) with the image's index and name; a final
+    summary line reports the image and error counts.
+    """
+    async def run(index, name, read):
+        try:
+            data = await run_in_threadpool(read)
+            result = await predict(data)
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            return {"index": index, "name": name, "error": detail}
+        return {"index": index, "name": name, **result}
+
+    images = iter(images)
+    pending = set()
+    n_images = n_errors = 0
+    exhausted = False
+    try:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency:
+                # Listing the next member may touch the archive on disk
+                item = await run_in_threadpool(next, images, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(run(n_images, *item)))
+                n_images += 1
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                n_errors += "error" in result
+                yield json.dumps(result) + "\n"
+    except Exception as e:
+        # A corrupt archive ends the stream; images already sent stay valid
+        n_errors += 1
+        yield json.dumps({"error": f"Could not read upload: {e}"}) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+
+    yield json.dumps({"done": True, "n_images": n_images, "n_errors": n_errors}) + "\n"
@@ -0,0 +1,305 @@
+"""
+Image validation from the encoded bytes, before anything is decoded.
+
+The format is sniffed from its magic bytes and the dimensions are read from
+the header (PNG, JPEG, TIFF, BMP, WebP and PNM), which for all but JPEGs
+with large metadata blocks lies within the first few KB. check_image adds
+a check that the file is complete, so truncated uploads are turned away
+instead of being decoded into partly blank images.
+"""
+import struct
+
+SUPPORTED_FORMATS = ("png", "jpeg", "tiff", "bmp", "webp", "pnm")
+# Enough of the file for read_header to find the dimensions in most images
+HEADER_BYTES = 64 * 1024
+
+# Formats that are recognised only to name them when they are rejected
+_OTHER_MAGIC = [(b"GIF8", "gif"), (b"\x00\x00\x00\x0cjP  ", "jpeg2000"), (b"\xff\x4f\xff\x51", "jpeg2000"),
+                (b"\x76\x2f\x31\x01", "openexr"), (b"#?RADIANCE", "hdr"), (b"\x59\xa6\x6a\x95", "sunraster"),
+                (b"%PDF", "pdf"), (b"DICM", "dicom")]
+
+
+class ImageHeaderError(ValueError):
+    """An upload that is not a usable image; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Keeps the status when raised in a worker process
+        return type(self), (str(self), self.status_code)
+
+
+def sniff_format(data):
+    """Format name from the magic bytes at the start of data, or None if unknown"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "tiff"
+    if data.startswith(b"BM"):
+        return "bmp"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if len(data) >= 2 and data[0:1] == b"P" and data[1:2] in b"123456" and data[2:3].isspace():
+        return "pnm"
+    if data[4:12] in (b"ftypavif", b"ftypheic"):
+        return data[8:12].decode()
+    for magic, name in _OTHER_MAGIC:
+        if data.startswith(magic) or (name == "dicom" and data[128:132] == magic):
+            return name
+    return None
+
+
+class _NeedMore(Exception):
+    """The header continues past the end of the bytes available"""
+
+
+def _unpack(fmt, data, offset):
+    end = offset + struct.calcsize(fmt)
+    if offset < 0 or end > len(data):
+        raise _NeedMore
+    return struct.unpack_from(fmt, data, offset)
+
+# ----- per-format headers: (width, height) -----
+def _png_size(data):
+    length, kind, width, height = _unpack(">I4sII", data, 8)
+    if kind != b"IHDR" or length != 13:
+        raise ImageHeaderError("Corrupt PNG header")
+    return width, height
+
+# Start-of-frame markers carry the dimensions (DHT, JPG and DAC share the range)
+_JPEG_FRAMES = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _jpeg_segments(data):
+    """(marker, offset of its length field) of each JPEG segment up to the first scan"""
+    offset = 2
+    while True:
+        # Markers may be preceded by any number of 0xFF fill bytes
+        (byte,) = _unpack("B", data, offset)
+        if byte != 0xFF:
+            raise ImageHeaderError("Corrupt JPEG header")
+        while True:
+            offset += 1
+            (marker,) = _unpack("B", data, offset)
+            if marker != 0xFF:
+                break
+        offset += 1
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # no payload
+        if marker == 0xD9:
+            raise ImageHeaderError("JPEG has no image data")
+        yield marker, offset
+        if marker == 0xDA:
+            return
+        (length,) = _unpack(">H", data, offset)
+        offset += length
+
+def _jpeg_size(data):
+    for marker, offset in _jpeg_segments(data):
+        if marker in _JPEG_FRAMES:
+            _, height, width = _unpack(">BHH", data, offset + 2)
+            if height == 0:
+                # Height given after the first scan (DNL marker)
+                raise ImageHeaderError("JPEG without its height in the frame header", 415)
+            return width, height
+    raise ImageHeaderError("JPEG has no frame header")
+
+_TIFF_TYPE_SIZES = {1: 1, 3: 2, 4: 4, 16: 8}  # BYTE, SHORT, LONG, LONG8
+_TIFF_TYPE_CODES = {1: "B", 3: "H", 4: "I", 16: "Q"}
+
+def _tiff_tags(data):
+    """{tag: tuple of values} of the first IFD for the integer tags, classic and BigTIFF"""
+    order = "<" if data[:2] == b"II" else ">"
+    (version,) = _unpack(order + "H", data, 2)
+    big = version == 43
+    if big:
+        (ifd,) = _unpack(order + "Q", data, 8)
+        (count,) = _unpack(order + "Q", data, ifd)
+        entry, inline, start = 20, 8, ifd + 8
+    else:
+        (ifd,) = _unpack(order + "I", data, 4)
+        (count,) = _unpack(order + "H", data, ifd)
+        entry, inline, start = 12, 4, ifd + 2
+    if count > 4096:
+        raise ImageHeaderError("Corrupt TIFF header")
+    tags = {}
+    for i in range(count):
+        at = start + i * entry
+        tag, kind = _unpack(order + "HH", data, at)
+        if kind not in _TIFF_TYPE_SIZES:
+            continue
+        (n,) = _unpack(order + ("Q" if big else "I"), data, at + 4)
+        values_at = at + (12 if big else 8)
+        if n * _TIFF_TYPE_SIZES[kind] > inline:
+            (values_at,) = _unpack(order + ("Q" if big else "I"), data, values_at)
+        if n > len(data):
+            raise ImageHeaderError("Corrupt TIFF header")
+        tags[tag] = _unpack(f"{order}{n}{_TIFF_TYPE_CODES[kind]}", data, values_at)
+    return tags
+
+def _tiff_size(data):
+    tags = _tiff_tags(data)
+    if 256 not in tags or 257 not in tags:
+        raise ImageHeaderError("TIFF without image dimensions")
+    return tags[256][0], tags[257][0]
+
+def _bmp_size(data):
+    (header_size,) = _unpack("<I", data, 14)
+    if header_size == 12:
+        width, height = _unpack("<HH", data, 18)
+    else:
+        width, height = _unpack("<ii", data, 18)
+    return width, abs(height)
+
+def _webp_size(data):
+    (chunk,) = _unpack("4s", data, 12)
+    if chunk == b"VP8X":
+        w = _unpack("<3B", data, 24)
+        h = _unpack("<3B", data, 27)
+        return 1 + (w[0] | w[1] << 8 | w[2] << 16), 1 + (h[0] | h[1] << 8 | h[2] << 16)
+    if chunk == b"VP8 ":
+        start_code, width, height = _unpack("<3sHH", data, 23)
+        if start_code != b"\x9d\x01\x2a":
+            raise ImageHeaderError("Corrupt WebP header")
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        signature, bits = _unpack("<BI", data, 20)
+        if signature != 0x2F:
+            raise ImageHeaderError("Corrupt WebP header")
+        return 1 + (bits & 0x3FFF), 1 + (bits >> 14 & 0x3FFF)
+    raise ImageHeaderError("Corrupt WebP header")
+
+def _pnm_fields(data):
+    """(header fields as ints, offset of the pixel data) of a PNM image"""
+    n_fields = 3 if data[1:2] in b"14" else 4
+    fields, offset = [], 2
+    while len(fields) < n_fields - 1:
+        if offset >= len(data):
+            raise _NeedMore
+        char = data[offset:offset + 1]
+        if char == b"#":
+            end = data.find(b"\n", offset)
+            if end < 0:
+                raise _NeedMore
+            offset = end + 1
+        elif char.isspace():
+            offset += 1
+        elif char.isdigit():
+            end = offset
+            while end < len(data) and data[end:end + 1].isdigit():
+                end += 1
+            if end == len(data):
+                raise _NeedMore
+            fields.append(int(data[offset:end]))
+            offset = end
+        else:
+            raise ImageHeaderError("Corrupt PNM header")
+    # A single whitespace byte separates the header from binary pixel data
+    return fields, offset + 1
+
+def _pnm_size(data):
+    fields, _ = _pnm_fields(data)
+    return fields[0], fields[1]
+
+_SIZE_READERS = {"png": _png_size, "jpeg": _jpeg_size, "tiff": _tiff_size, "bmp": _bmp_size,
+                 "webp": _webp_size, "pnm": _pnm_size}
+
+
+def read_header(data, complete=True):
+    """
+    (format, width, height) from the start of an encoded image. With
+    complete=False, data may be just the first bytes of the file: None means
+    more are needed. Raises ImageHeaderError for unsupported formats (415)
+    and corrupt or truncated headers (400).
+    """
+    data = memoryview(data).tobytes() if not isinstance(data, bytes) else data
+    if not complete and len(data) < 32:
+        return None
+    if not data:
+        raise ImageHeaderError("Empty file")
+    fmt = sniff_format(data)
+    if fmt not in SUPPORTED_FORMATS:
+        kind = f" ({fmt})" if fmt else ""
+        raise ImageHeaderError(f"Unsupported image format{kind}; expected one of "
+                               f"{', '.join(f.upper() for f in SUPPORTED_FORMATS)}", 415)
+    try:
+        width, height = _SIZE_READERS[fmt](data)
+    except _NeedMore:
+        if not complete:
+            return None
+        raise ImageHeaderError(f"Truncated {fmt.upper()} header")
+    if width <= 0 or height <= 0:
+        raise ImageHeaderError(f"{fmt.upper()} image has no pixels")
+    return fmt, width, height
+
+# ----- completeness: True when the end of the file is there -----
+def _png_complete(data):
+    return data.rfind(b"IEND\xaeB`\x82") > 8
+
+def _jpeg_complete(data):
+    # End-of-image after the first scan; some cameras append data after it
+    *_, (_, scan) = _jpeg_segments(data)
+    return data.rfind(b"\xff\xd9") > scan
+
+def _tiff_complete(data):
+    tags = _tiff_tags(data)
+    for offsets, counts in ((273, 279), (324, 325)):
+        if offsets in tags and counts in tags:
+            return max(o + c for o, c in zip(tags[offsets], tags[counts])) <= len(data)
+    return True
+
+def _bmp_complete(data):
+    (declared,) = _unpack("<I", data, 2)
+    return len(data) >= declared
+
+def _webp_complete(data):
+    (riff_size,) = _unpack("<I", data, 4)
+    return len(data) >= 8 + riff_size
+
+def _pnm_complete(data):
+    kind = data[1:2]
+    if kind in b"123":
+        return True  # plain-text pixels
+    fields, offset = _pnm_fields(data)
+    width, height = fields[0], fields[1]
+    if kind == b"4":
+        needed = (width + 7) // 8 * height
+    else:
+        channels = 3 if kind == b"6" else 1
+        needed = width * height * channels * (2 if fields[2] > 255 else 1)
+    return len(data) - offset >= needed
+
+_COMPLETE_CHECKS = {"png": _png_complete, "jpeg": _jpeg_complete, "tiff": _tiff_complete,
+                    "bmp": _bmp_complete, "webp": _webp_complete, "pnm": _pnm_complete}
+
+
+def check_pixels(fmt, width, height, max_pixels):
+    """ImageHeaderError (413) when width x height exceeds max_pixels (0 allows any size)"""
+    if max_pixels and width * height > max_pixels:
+        raise ImageHeaderError(f"{fmt.upper()} image of {width}x{height} pixels exceeds "
+                               f"MAX_IMAGE_PIXELS={max_pixels}", 413)
+
+def check_image(data, max_pixels=0):
+    """
+    read_header(data) plus the pixel limit and a check that the whole file
+    is there; returns (format, width, height) or raises ImageHeaderError
+    """
+    fmt, width, height = read_header(data)
+    check_pixels(fmt, width, height, max_pixels)
+    try:
+        complete = _COMPLETE_CHECKS[fmt](data)
+    except _NeedMore:
+        complete = False
+    if not complete:
+        raise ImageHeaderError(f"Truncated {fmt.upper()} file")
+    return fmt, width, height
+
+def reduction_factor(width, height, max_pixels):
+    """Smallest of 1, 2, 4 and 8 that brings the image within max_pixels (0: always 1)"""
+    for factor in (1, 2, 4):
+        if not max_pixels or width * height <= max_pixels * factor * factor:
+            return factor
+    return 8
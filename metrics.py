@@ -0,0 +1,262 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are grouped in a Registry and rendered by
+`Registry.render()` for the /metrics endpoint. `stage(timings, name)` times a
+block into a plain dict; with `timings=None` it is a shared no-op context, so
+instrumented code costs nothing when metrics are switched off. Inside
+`stage_memory()`, timed stages also record their peak allocation.
+"""
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+from starlette.routing import Match
+
+# Latency buckets in seconds (0.5 ms to 60 s)
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+# ======================
+# Stage timing
+# ======================
+_NO_STAGE = nullcontext()
+# Per-thread {stage: peak bytes} while stage_memory() is active
+_stage_peaks = threading.local()
+
+class _StageTimer:
+    __slots__ = ("timings", "name", "start", "peaks", "base")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.peaks = getattr(_stage_peaks, "peaks", None)
+        if self.peaks is not None:
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+        if self.peaks is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peaks[self.name] = max(self.peaks.get(self.name, 0), peak - self.base)
+            self.peaks["total"] = max(self.peaks["total"], peak - _stage_peaks.base)
+
+def stage(timings, name):
+    """Add the duration of the with-block to timings[name] (no-op when timings is None)"""
+    if timings is None:
+        return _NO_STAGE
+    return _StageTimer(timings, name)
+
+@contextmanager
+def stage_memory():
+    """
+    Trace allocations (tracemalloc) while the with-block runs and yield a dict
+    filled with the peak bytes each timed stage allocated on top of what was
+    held when it started, plus "total": the peak over the whole block. Meant
+    for one extraction at a time per process: tracemalloc's peak is global.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    peaks = {"total": 0}
+    _stage_peaks.base = tracemalloc.get_traced_memory()[0]
+    _stage_peaks.peaks = peaks
+    try:
+        yield peaks
+    finally:
+        _stage_peaks.peaks = None
+        if started:
+            tracemalloc.stop()
+
+
+# ======================
+# Metric types
+# ======================
+class Histogram:
+    """Bucketed observations (counts of observations <= each bound)"""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        buckets, total = {}, 0
+        for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+    def samples(self, name, labels):
+        snap = self.snapshot()
+        for bound, total in snap["buckets"].items():
+            yield f"{name}_bucket", {**labels, "le": bound}, total
+        yield f"{name}_sum", labels, snap["sum"]
+        yield f"{name}_count", labels, snap["count"]
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+class Gauge(Counter):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class Family:
+    """A named metric with one child per combination of label values"""
+
+    def __init__(self, name, help, kind, labelnames, factory):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            for sample_name, labels, value in child.samples(self.name, dict(zip(self.labelnames, values))):
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def metric_lines(name, help, kind, samples):
+    """Exposition lines for externally held values: samples is [(labels, value or Histogram)]"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        children = value.samples(name, labels) if isinstance(value, Histogram) else [(name, labels, value)]
+        for sample_name, sample_labels, sample_value in children:
+            lines.append(f"{sample_name}{_format_labels(sample_labels)} {_format_value(sample_value)}")
+    return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Family(name, help, "counter", labelnames, Counter))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Family(name, help, "gauge", labelnames, Gauge))
+
+    def histogram(self, name, help, bounds, labelnames=()):
+        return self._add(Family(name, help, "histogram", labelnames, lambda: Histogram(bounds)))
+
+    def collector(self, fn):
+        """Register fn() -> list of exposition lines, evaluated at render time"""
+        self._collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for fn in self._collectors:
+            lines.extend(fn())
+        return "\n".join(lines) + "\n"
+
+
+# ======================
+# HTTP middleware
+# ======================
+class MetricsMiddleware:
+    """Count requests, errors, in-flight requests and latency per route"""
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by route and status", ["route", "status"])
+        self.errors = registry.counter(
+            "http_request_errors_total", "HTTP requests answered with a 5xx status", ["route"])
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being handled", ["route"])
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ["route"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = _route_label(scope)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = self.in_flight.labels(route)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            self.requests.labels(route, str(status)).inc()
+            if status >= 500:
+                self.errors.labels(route).inc()
+            self.latency.labels(route).observe(time.perf_counter() - start)
+
+def _route_label(scope):
+    """Route template of the request (bounded label cardinality), or 'unmatched'"""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
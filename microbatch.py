@@ -0,0 +1,81 @@
+"""
+Dynamic micro-batching for single-row predictions.
+
+Concurrent requests are collected for at most max_wait_us microseconds (or
+until max_batch_size rows are waiting), scored with one vectorized call in a
+worker thread, and the per-row results are handed back to each waiting
+request.
+"""
+import asyncio
+import time
+
+import numpy as np
+
+from metrics import Histogram
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch_size, max_wait_us):
+        # fn(X) -> sequence with one result per row of X
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+        self._pending = []  # (row, future, enqueued_at)
+        self._timer = None
+        self._tasks = set()
+
+        sizes = [1]
+        while sizes[-1] < max_batch_size:
+            sizes.append(min(sizes[-1] * 2, max_batch_size))
+        self.batch_sizes = Histogram(sizes)
+        self.queue_delay_us = Histogram([50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000])
+
+    async def submit(self, row):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_us / 1e6, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            self.queue_delay_us.observe((started - enqueued_at) * 1e6)
+
+        X = np.array([row for row, _, _ in batch], dtype=float)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.fn, X)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            # Requests whose client went away have a cancelled future
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": self.max_wait_us,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_delay_us": self.queue_delay_us.snapshot(),
+        }
@@ -0,0 +1,614 @@
+"""
+Decision tree grown by Q-learning (from the reinforcement notebook).
+
+A state is a node of the tree (the training samples that reach it) and an
+action is a split (feature, threshold) of that node, rewarded with its
+information gain. Episodes start at the root and keep splitting the larger
+child; the learned Q-table then picks the split of every node when the tree
+is built. compile_tree flattens a built tree into arrays for batch
+prediction and .npz files.
+"""
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Nodes holding less than these shares of the samples sort their own values
+# instead of masking the presorted index. Split gains, which also need the
+# labels in sorted order, gain from the mask down to much smaller nodes than
+# the thresholds alone (benchmarks/bench_qtree.py, 10k and 100k rows).
+THRESHOLDS_SORT_SHARE = 2 / 3
+GAINS_SORT_SHARE = 1 / 12
+# CompiledQTree.predict walks the rows in chunks small enough to stay in cache
+PREDICT_CHUNK_ROWS = 4096
+
+
+# ======================
+# Environment
+# ======================
+def _run_ends(values):
+    """Mask of the last element of every run of equal values in a sorted array"""
+    last = np.empty(len(values), dtype=bool)
+    if len(values):
+        np.not_equal(values[1:], values[:-1], out=last[:-1])
+        last[-1] = True
+    return last
+
+def _last_of_runs(values):
+    """Positions of the last element of every run of equal values in a sorted array"""
+    return np.flatnonzero(_run_ends(values))
+
+def _distinct(values):
+    """The distinct values of a sorted array, in order (a boolean mask beats indexing by position)"""
+    return values[_run_ends(values)]
+
+def _entropy(positives, counts):
+    """TreeEnv.information_gain's entropy of nodes with these positive and total label counts"""
+    p = np.divide(positives, counts, out=np.zeros(len(counts)), where=counts > 0)
+    pure = (p == 0) | (p == 1)
+    q = np.where(pure, 0.5, p)  # keeps log2 finite where the result is 0 anyway
+    return np.where(pure, 0.0, -q*np.log2(q) - (1-q)*np.log2(1-q))
+
+class TreeEnv:
+    def __init__(self, X, y):
+        self.X = np.array(X, dtype=float)
+        self.y = np.array(y, dtype=int)
+        self.n_samples, self.n_features = self.X.shape
+        # Presorted index, built once: order[f] lists the samples by increasing
+        # X[:, f] and sorted_X[f] holds those values
+        self.order = np.argsort(self.X, axis=0, kind="stable").T.copy()
+        self.sorted_X = np.take_along_axis(self.X.T, self.order, axis=1)
+        # Action IDs: the distinct values of every feature, numbered feature by feature
+        self.distinct = [_distinct(values) for values in self.sorted_X]
+        self.action_offsets = np.concatenate([[0], np.cumsum([len(d) for d in self.distinct])])
+
+    def sorted_columns(self, indices, labels=False):
+        """
+        X[indices, f] in increasing order for every feature f; with labels,
+        (those values, the node's labels in the same order), ties in index order
+        """
+        indices = np.asarray(indices)
+        if len(indices) < (GAINS_SORT_SHARE if labels else THRESHOLDS_SORT_SHARE) * self.n_samples:
+            # Smaller nodes: sorting their own values beats a pass over the whole index
+            if not labels:
+                return [np.sort(self.X[indices, f]) for f in range(self.n_features)]
+            order = np.argsort(self.X[indices].T, axis=1, kind="stable")
+            values = np.take_along_axis(self.X[indices].T, order, axis=1)
+            return zip(values, self.y[indices][order])
+        member = np.zeros(self.n_samples, dtype=bool)
+        member[indices] = True
+        # Which of the presorted positions belong to the node, for every feature at once
+        in_node = member[self.order]
+        if not labels:
+            return (values[keep] for values, keep in zip(self.sorted_X, in_node))
+        return ((values[keep], self.y[order[keep]])
+                for values, order, keep in zip(self.sorted_X, self.order, in_node))
+
+    def thresholds(self, indices):
+        """Distinct values of X[indices, f] for every feature f, in increasing order"""
+        return [_distinct(values) for values in self.sorted_columns(indices)]
+
+    def split_gains(self, indices):
+        """
+        (features, thresholds, gains) of every action of the node, in the order
+        of get_possible_actions. Each gain equals information_gain of that
+        split; all thresholds of a feature come from one pass of cumulative
+        label counts along its sorted values.
+        """
+        features, thresholds, gains = [], [], []
+        for f, (values, labels) in enumerate(self.sorted_columns(indices, labels=True)):
+            ends = _last_of_runs(values)
+            n = len(values)
+            n_left = ends + 1
+            pos_left = np.cumsum(labels)[ends]
+            pos = pos_left[-1] if n else 0
+            n_right = n - n_left
+            gain = (_entropy(np.array([pos]), np.array([n]))
+                    - (n_left / n) * _entropy(pos_left, n_left)
+                    - (n_right / n) * _entropy(pos - pos_left, n_right))
+            features.append(np.full(len(ends), f))
+            thresholds.append(values[ends])
+            gains.append(gain)
+        return np.concatenate(features), np.concatenate(thresholds), np.concatenate(gains)
+
+    def actions(self, indices):
+        """(features, thresholds, action IDs) of every split of the node, in get_possible_actions order"""
+        thresholds = self.thresholds(indices)
+        features = np.repeat(np.arange(self.n_features), [len(t) for t in thresholds])
+        ids = np.concatenate([self.action_offsets[f] + np.searchsorted(self.distinct[f], t)
+                              for f, t in enumerate(thresholds)])
+        return features, np.concatenate(thresholds), ids
+
+    def first_action(self, indices):
+        """ID of the node's first action: the smallest value of feature 0"""
+        return int(np.searchsorted(self.distinct[0], self.X[indices, 0].min()))
+
+    def action(self, action_id):
+        """(feature, threshold) of an action ID"""
+        f = int(np.searchsorted(self.action_offsets, action_id, side="right")) - 1
+        return f, float(self.distinct[f][action_id - self.action_offsets[f]])
+
+    def state_key(self, indices):
+        """Fingerprint of the node holding indices: a 128-bit hash of its membership bitset"""
+        member = np.zeros(self.n_samples, dtype=bool)
+        member[indices] = True
+        return hashlib.blake2b(np.packbits(member).tobytes(), digest_size=16).digest()
+
+    def get_possible_actions(self, indices):
+        """Every (feature, threshold) split of the node, as np.unique would list them"""
+        return [(f, t) for f, values in enumerate(self.thresholds(indices)) for t in values.tolist()]
+
+    def step(self, indices, action):
+        indices = np.array(indices)
+        f, t = action
+        left_indices = indices[self.X[indices, f] <= t]
+        right_indices = indices[self.X[indices, f] > t]
+        reward = self.information_gain(indices, left_indices, right_indices)
+        return left_indices, right_indices, reward
+
+    def information_gain(self, parent_indices, left_indices, right_indices):
+        def entropy(indices):
+            if len(indices) == 0:
+                return 0
+            p = np.mean(self.y[indices])
+            if p == 0 or p == 1:
+                return 0
+            return -p*np.log2(p) - (1-p)*np.log2(1-p)
+
+        n = len(parent_indices)
+        n_left = len(left_indices)
+        n_right = len(right_indices)
+
+        gain = entropy(parent_indices) - (n_left/n)*entropy(left_indices) - (n_right/n)*entropy(right_indices)
+        return gain
+
+
+# ======================
+# Q-learning
+# ======================
+class QTable:
+    """
+    Q values by (state, action ID), states being TreeEnv.state_key
+    fingerprints. Each state holds the IDs of the actions written so far
+    (sorted), their values and how many times each was written in NumPy
+    arrays, plus the position of its best value, kept up to date on every
+    write so the best action and the maximum are read in constant time.
+    Actions never written are worth 0. With max_states, the least recently
+    used states are dropped once there are more.
+    """
+
+    def __init__(self, max_states=None):
+        self.max_states = max_states
+        # state -> [action IDs, values, position of the best value, visits, clock of the last write]
+        self._states = OrderedDict()
+        self.evicted = 0
+        self.clock = 0  # writes so far
+
+    def __getstate__(self):
+        # A few flat arrays pickle far faster than one small array per state
+        states = list(self._states.items())
+        lengths = np.array([len(found[0]) for _, found in states], dtype=np.int64)
+        flat = {name: np.concatenate([found[i] for _, found in states]) if states else np.zeros(0, dtype)
+                for i, name, dtype in ((0, "ids", np.int64), (1, "values", float), (3, "visits", np.int32))}
+        meta = np.array([(found[2], found[4]) for _, found in states], dtype=np.int64).reshape(-1, 2)
+        return {"keys": b"".join(state for state, _ in states), "key_size": len(states[0][0]) if states else 0,
+                "lengths": lengths, "meta": meta, **flat,
+                "max_states": self.max_states, "evicted": self.evicted, "clock": self.clock}
+
+    def __setstate__(self, data):
+        self.max_states, self.evicted, self.clock = data["max_states"], data["evicted"], data["clock"]
+        keys, size = data["keys"], data["key_size"]
+        ids, values, visits = data["ids"], data["values"], data["visits"]
+        bounds = [0] + np.cumsum(data["lengths"]).tolist()
+        self._states = OrderedDict(
+            (keys[i * size:(i + 1) * size], [ids[a:b], values[a:b], best, visits[a:b], written])
+            for i, (a, b, (best, written)) in enumerate(zip(bounds, bounds[1:], data["meta"].tolist())))
+
+    def __len__(self):
+        """Number of (state, action) values stored"""
+        return sum(len(found[0]) for found in self._states.values())
+
+    @property
+    def n_states(self):
+        return len(self._states)
+
+    @property
+    def nbytes(self):
+        """Bytes of the stored keys and arrays (not the Python containers)"""
+        return sum(len(state) + ids.nbytes + values.nbytes + visits.nbytes
+                   for state, (ids, values, _, visits, _) in self._states.items())
+
+    def _lookup(self, state):
+        found = self._states.get(state)
+        if found is not None and self.max_states is not None:
+            self._states.move_to_end(state)
+        return found
+
+    def _trim(self):
+        while self.max_states is not None and len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+            self.evicted += 1
+
+    def values(self, state, action_ids):
+        """Q values of the state's actions action_ids (sorted, as TreeEnv.actions returns them)"""
+        q = np.zeros(len(action_ids))
+        found = self._lookup(state)
+        if found is not None:
+            q[np.searchsorted(action_ids, found[0])] = found[1]
+        return q
+
+    def get(self, state, action_id):
+        found = self._lookup(state)
+        if found is None:
+            return 0
+        ids, values = found[:2]
+        i = np.searchsorted(ids, action_id)
+        return values[i] if i < len(ids) and ids[i] == action_id else 0
+
+    def best(self, state):
+        """(action ID, value) of the highest written value of the state (lowest ID on ties), or None"""
+        found = self._lookup(state)
+        if found is None:
+            return None
+        ids, values, best = found[:3]
+        return ids[best], values[best]
+
+    def max(self, state):
+        """Highest Q value of the state's actions (0 for actions never written)"""
+        found = self._lookup(state)
+        return 0 if found is None else max(0, found[1][found[2]].item())
+
+    def set(self, state, action_id, value):
+        self.clock += 1
+        found = self._lookup(state)
+        if found is None:
+            self._states[state] = [np.array([action_id], dtype=np.int64), np.array([value], dtype=float), 0,
+                                   np.ones(1, dtype=np.int32), self.clock]
+            self._trim()
+            return
+        ids, values, best, visits = found[:4]
+        found[4] = self.clock
+        i = np.searchsorted(ids, action_id)
+        if i < len(ids) and ids[i] == action_id:
+            visits[i] += 1
+            lowered = i == best and value < values[i]
+            values[i] = value
+            if lowered:
+                # Only a lower best value needs a look at the state's other values
+                found[2] = int(np.argmax(values))
+                return
+        else:
+            found[0], found[1] = ids, values = np.insert(ids, i, action_id), np.insert(values, i, value)
+            found[3] = np.insert(visits, i, 1)
+            if best >= i:
+                best = found[2] = best + 1
+        if value > values[best] or (value == values[best] and i < best):
+            found[2] = i
+
+    def items(self):
+        """(state, action IDs, values) of every stored state"""
+        for state, (ids, values, *_) in self._states.items():
+            yield state, ids, values
+
+    def written_since(self, clock):
+        """QTable of the states written after the table's clock read clock (shares their arrays)"""
+        table = QTable(self.max_states)
+        table._states = OrderedDict((state, found) for state, found in self._states.items() if found[4] > clock)
+        return table
+
+    def merge(self, tables):
+        """
+        Fold in tables trained from copies of this one (or the states they
+        wrote, see written_since). Each (state, action) takes the average of
+        the tables' values weighted by the number of writes each made since
+        the copy; one written by a single table takes its value as is, and
+        one no table wrote keeps its own.
+        """
+        copies = {}  # state -> its entries in the tables that wrote it
+        for table in tables:
+            for state, found in table._states.items():
+                copies.setdefault(state, []).append(found)
+
+        for state, found in copies.items():
+            base = self._states.get(state)
+            if base is None and len(found) == 1:
+                # A state only one table has seen is taken as it is
+                self.clock += 1
+                self._states[state] = found[0][:4] + [self.clock]
+                if self.max_states is not None:
+                    self._states.move_to_end(state)
+                continue
+            parts = []  # (action IDs, values, new writes) of each table
+            for ids, values, _, visits, _ in found:
+                new = visits.astype(np.int64)
+                if base is not None:
+                    # The table may have dropped (LRU) and rebuilt the state, so match the IDs
+                    at = np.minimum(np.searchsorted(ids, base[0]), len(ids) - 1)
+                    known = ids[at] == base[0]
+                    new[at[known]] -= base[3][known]
+                keep = new > 0
+                if keep.any():
+                    parts.append((ids[keep], values[keep], new[keep]))
+            if not parts:
+                continue
+            ids, values, new = (np.concatenate(arrays) for arrays in zip(*parts))
+            merged_ids, first, inverse, tables_per_id = np.unique(ids, return_index=True, return_inverse=True,
+                                                                  return_counts=True)
+            weights = np.bincount(inverse, new)
+            merged = np.where(tables_per_id == 1, values[first],
+                              np.bincount(inverse, values * new) / weights)
+            if base is None:
+                all_ids, all_values, all_visits = merged_ids, merged, weights.astype(np.int32)
+            else:
+                all_ids = np.union1d(base[0], merged_ids)
+                all_values = np.zeros(len(all_ids))
+                all_visits = np.zeros(len(all_ids), dtype=np.int32)
+                at = np.searchsorted(all_ids, base[0])
+                all_values[at], all_visits[at] = base[1], base[3]
+                at = np.searchsorted(all_ids, merged_ids)
+                all_values[at] = merged
+                all_visits[at] += weights.astype(np.int32)
+            self.clock += 1
+            self._states[state] = [all_ids, all_values, int(np.argmax(all_values)), all_visits, self.clock]
+            if self.max_states is not None:
+                self._states.move_to_end(state)
+        self._trim()
+
+def greedy_action(env, Q, state, indices, gain_prior=False):
+    """
+    ID of the node's action with the highest Q value, the first one on ties.
+    A positive best stored value wins outright (every other action is worth
+    at most that) and a state with no values takes its first action; only
+    the rest scan the node's actions. With gain_prior, a node whose actions
+    are all worth 0 takes its highest-gain split.
+    """
+    best = Q.best(state)
+    if best is not None and best[1] > 0:
+        return best[0]
+    if best is None and not gain_prior:
+        return env.first_action(indices)
+    features, thresholds, ids = env.actions(indices)
+    q_vals = Q.values(state, ids)
+    if gain_prior and not q_vals.any():
+        q_vals = env.split_gains(indices)[2]
+    return ids[np.argmax(q_vals)]
+
+def run_episode(env, Q, alpha=0.1, gamma=0.9, epsilon=0.1, rng=np.random, max_steps=None, gain_prior=False):
+    """
+    One episode from the root, updating the QTable Q in place; returns the
+    number of steps taken. With gain_prior, a greedy step in a state whose
+    actions all have Q = 0 takes the split with the highest information gain
+    instead of the first one.
+    """
+    indices = np.arange(len(env.y))
+    done = False
+    steps = 0
+
+    while not done and (max_steps is None or steps < max_steps):
+        if not len(indices):
+            break
+        state = env.state_key(indices)
+
+        # epsilon-greedy
+        if rng.rand() < epsilon:
+            features, thresholds, ids = env.actions(indices)
+            action_id = ids[rng.randint(len(ids))]
+        else:
+            action_id = greedy_action(env, Q, state, indices, gain_prior)
+        action = env.action(action_id)
+
+        left, right, reward = env.step(indices, action)
+
+        # Next state max Q
+        max_next = max(Q.max(env.state_key(left)), Q.max(env.state_key(right)))
+
+        # Update Q
+        old = Q.get(state, action_id)
+        Q.set(state, action_id, old + alpha * (reward + gamma*max_next - old))
+
+        # Continue with the larger child
+        indices = left if len(left) >= len(right) else right
+        steps += 1
+
+        if len(left) == 0 or len(right) == 0:
+            done = True
+    return steps
+
+def train(env, n_episodes=200, alpha=0.1, gamma=0.9, epsilon=0.1, rng=np.random, Q=None, gain_prior=False,
+          max_states=None):
+    """QTable after n_episodes episodes (continuing from Q when given)"""
+    Q = QTable(max_states) if Q is None else Q
+    for _ in range(n_episodes):
+        run_episode(env, Q, alpha, gamma, epsilon, rng, gain_prior=gain_prior)
+    return Q
+
+# Environment of the train_parallel worker processes, sent once when they start
+_worker_env = None
+
+def _init_worker(env):
+    global _worker_env
+    _worker_env = env
+
+def _train_worker(Q, n_episodes, seed, alpha, gamma, epsilon, gain_prior):
+    """The states of Q that n_episodes episodes wrote"""
+    clock = Q.clock
+    train(_worker_env, n_episodes, alpha, gamma, epsilon, np.random.RandomState(seed), Q, gain_prior)
+    return Q.written_since(clock)
+
+def train_parallel(env, n_episodes=200, workers=None, sync_every=10, alpha=0.1, gamma=0.9, epsilon=0.1,
+                   seed=0, gain_prior=False, max_states=None):
+    """
+    train across worker processes. In every round each worker continues a
+    copy of the shared QTable for sync_every episodes with its own random
+    seed, and the copies are merged back (QTable.merge, weighted by visits)
+    before the next round. One worker trains in this process.
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    Q = QTable(max_states)
+    seeds = np.random.SeedSequence(seed)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(env,))
+    else:
+        _init_worker(env)
+    try:
+        remaining = n_episodes
+        while remaining > 0:
+            # The last round shares out what is left
+            counts = [min(sync_every, max(0, remaining - w * sync_every)) for w in range(workers)]
+            counts = [n for n in counts if n]
+            remaining -= sum(counts)
+            args = [(Q, n, s.generate_state(4), alpha, gamma, epsilon, gain_prior)
+                    for n, s in zip(counts, seeds.spawn(len(counts)))]
+            if executor is None:
+                # Trains Q itself; nothing to merge
+                _train_worker(*args[0])
+            else:
+                Q.merge([f.result() for f in [executor.submit(_train_worker, *a) for a in args]])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return Q
+
+
+# ======================
+# Tree
+# ======================
+class QDecisionTreeNode:
+    def __init__(self, indices, depth=0, max_depth=5):
+        self.indices = indices
+        self.depth = depth
+        self.max_depth = max_depth
+        self.left = None
+        self.right = None
+        self.feature = None
+        self.threshold = None
+        self.label = None
+
+    def build(self, env, Q, gain_prior=False):
+        """Split with the highest Q value (see run_episode for gain_prior) down to max_depth"""
+        y_node = env.y[self.indices]
+        if len(np.unique(y_node)) == 1 or self.depth >= self.max_depth:
+            self.label = np.round(np.mean(y_node))
+            return
+
+        if not len(self.indices):
+            self.label = np.round(np.mean(y_node))
+            return
+
+        # Split with the highest Q value
+        state = env.state_key(self.indices)
+        self.feature, self.threshold = env.action(greedy_action(env, Q, state, self.indices, gain_prior))
+
+        left_indices = self.indices[env.X[self.indices, self.feature] <= self.threshold]
+        right_indices = self.indices[env.X[self.indices, self.feature] > self.threshold]
+
+        if len(left_indices) == 0 or len(right_indices) == 0:
+            self.label = np.round(np.mean(y_node))
+            return
+
+        self.left = QDecisionTreeNode(left_indices, self.depth+1, self.max_depth)
+        self.left.build(env, Q, gain_prior)
+        self.right = QDecisionTreeNode(right_indices, self.depth+1, self.max_depth)
+        self.right.build(env, Q, gain_prior)
+
+def predict_tree(node, X):
+    preds = []
+    for x in X:
+        current = node
+        while current.label is None:
+            if x[current.feature] <= current.threshold:
+                current = current.left
+            else:
+                current = current.right
+        preds.append(current.label)
+    return np.array(preds)
+
+
+# ======================
+# Compiled tree
+# ======================
+class CompiledQTree:
+    """
+    A built QDecisionTreeNode flattened into parallel node arrays, without
+    the training indices. Node 0 is the root; leaves have left == right == -1
+    and their label in value. predict moves every row of a batch down one
+    level at a time and matches predict_tree exactly (NaN goes right).
+    """
+
+    def __init__(self, feature, threshold, left, right, value):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+
+        # Interleaved (left, right) children: child of node n is children[2n + go_right];
+        # leaves point to themselves so rows that reach one early stay there
+        nodes = np.arange(len(self.left), dtype=np.int32)
+        is_leaf = self.left < 0
+        self._children = np.column_stack([np.where(is_leaf, nodes, self.left),
+                                          np.where(is_leaf, nodes, self.right)]).ravel()
+        # Children always come after their parent (see compile_tree)
+        depth = np.zeros(len(nodes), dtype=np.int32)
+        for node in np.flatnonzero(~is_leaf):
+            depth[self.left[node]] = depth[self.right[node]] = depth[node] + 1
+        self.depth = int(depth.max(initial=0))
+
+    def __len__(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """Leaf node index of every row of X"""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        leaves = np.empty(X.shape[0], dtype=np.int32)
+        row_offset = np.arange(min(X.shape[0], PREDICT_CHUNK_ROWS)) * X.shape[1]
+        for start in range(0, X.shape[0], PREDICT_CHUNK_ROWS):
+            chunk = X[start:start + PREDICT_CHUNK_ROWS]
+            flat_x, offset = chunk.ravel(), row_offset[:len(chunk)]
+            node = np.zeros(len(chunk), dtype=np.int32)
+            for _ in range(self.depth):
+                x = flat_x.take(offset + self.feature.take(node))
+                go_right = ~(x <= self.threshold.take(node))
+                node = self._children.take(2 * node + go_right)
+            leaves[start:start + PREDICT_CHUNK_ROWS] = node
+        return leaves
+
+    def predict(self, X):
+        """Labels of the rows of X, like predict_tree(root, X)"""
+        return self.value.take(self.apply(X))
+
+    # ----- persistence -----
+    def save(self, path):
+        np.savez_compressed(path, feature=self.feature, threshold=self.threshold, left=self.left,
+                            right=self.right, value=self.value)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["feature"], data["threshold"], data["left"], data["right"], data["value"])
+
+
+def compile_tree(root):
+    """Flatten a built QDecisionTreeNode tree into a CompiledQTree, numbering nodes breadth first"""
+    nodes = [root]
+    feature, threshold, left, right, value = [], [], [], [], []
+    for node in nodes:  # grows as children are numbered
+        if node.label is not None:
+            feature.append(0)
+            threshold.append(0.0)
+            left.append(-1)
+            right.append(-1)
+            value.append(node.label)
+        else:
+            feature.append(node.feature)
+            threshold.append(node.threshold)
+            left.append(len(nodes))
+            right.append(len(nodes) + 1)
+            value.append(np.nan)
+            nodes += [node.left, node.right]
+    return CompiledQTree(feature, threshold, left, right, value)
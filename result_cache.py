@@ -0,0 +1,138 @@
+"""
+Content-addressed cache for prediction results.
+
+Entries are keyed by a hash of the request content (image bytes or the
+30-float feature vector) and namespaced by a hash of the model file and the
+extraction settings, so a new model or setting never serves results computed
+by an old one. The in-memory tier is an LRU bounded by total bytes and entry
+age; an optional SQLite file keeps results across restarts.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes, ttl, namespace, disk_path=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (payload, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "disk_hits": 0}
+
+        self._db = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    # ----- disk tier -----
+    def _open_disk(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, namespace TEXT, payload TEXT, expires_at REAL)"
+        )
+        # Drop results of other model versions and anything already expired
+        self._db.execute("DELETE FROM results WHERE namespace != ? OR expires_at < ?",
+                         (self.namespace, time.time()))
+
+    def _disk_get(self, key):
+        row = self._db.execute(
+            "SELECT payload, expires_at FROM results WHERE key = ? AND namespace = ?",
+            (key, self.namespace)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row
+
+    def _disk_put(self, key, payload, expires_at):
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                         (key, self.namespace, payload, expires_at))
+
+    # ----- memory tier -----
+    def _store(self, key, payload, expires_at):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[0])
+        self._entries[key] = (payload, expires_at)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes and self._entries:
+            _, (old_payload, _) = self._entries.popitem(last=False)
+            self._bytes -= len(old_payload)
+            self.counters["evictions"] += 1
+
+    def get(self, key):
+        """Return a fresh copy of the cached value, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                self._bytes -= len(self._entries.pop(key)[0])
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._disk_get(key)
+                if entry is not None:
+                    self.counters["disk_hits"] += 1
+                    self._store(key, *entry)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            payload = entry[0]
+        return json.loads(payload)
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        if len(payload) > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, payload, expires_at)
+            if self._db is not None:
+                self._disk_put(key, payload, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "namespace": self.namespace,
+                "disk": self._db is not None,
+            }
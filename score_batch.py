@@ -0,0 +1,386 @@
+"""
+Offline batch scoring, without the HTTP API.
+
+    python score_batch.py scans/ results.csv            # a directory of images
+    python score_batch.py features.csv results.parquet  # rows of the 30 features
+    python score_batch.py feature_store/ results.csv    # every image in a feature store
+
+Input is a directory of images (searched recursively), a CSV/Parquet file
+with the 30 feature columns, or a feature store directory. Chunks are scored on a pool of worker processes
+and appended to the output (CSV, or Parquet part files in a directory) in
+input order. A checkpoint next to the output records the chunks written, so
+an interrupted run picks up where it stopped when started again with the
+same arguments. Run from the repository root, like the API.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import FEATURE_ORDER, extract_features, load_model, open_feature_store, score_rows
+from feature_store import FeatureStore
+from result_cache import content_hash
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+RESULT_COLUMNS = ["prediction", "confidence", "error"]
+
+
+# ======================
+# Workers
+# ======================
+# Feature store the image workers read from (the driver does the writing)
+_feature_store = None
+
+def _init_worker(feature_store_path=None):
+    global _feature_store
+    warnings.filterwarnings("ignore")
+    # Ctrl-C reaches the whole process group; the driver decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if feature_store_path:
+        _feature_store = open_feature_store(feature_store_path)
+    load_model()
+
+def _results(labels, confidences):
+    return [{"prediction": "Malignant" if label == 1 else "Benign",
+             "confidence": None if confidence is None else float(confidence)}
+            for label, confidence in zip(labels, confidences)]
+
+def score_row_chunk(X):
+    """Results for a float array of rows in FEATURE_ORDER; rows with missing values get an error"""
+    results = [{"error": "row: missing or non-numeric value"}] * len(X)
+    valid = np.flatnonzero(~np.isnan(X).any(axis=1))
+    if valid.size:
+        for i, result in zip(valid, _results(*score_rows(X[valid]))):
+            results[i] = result
+    return results
+
+def score_image_chunk(paths):
+    """
+    Results, including the image hash and the extracted features, for image
+    files. Features already in the feature store are not extracted again.
+    """
+    results = [None] * len(paths)
+    valid, X = [], []
+    for i, path in enumerate(paths):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            key = content_hash(data)
+            stored = _feature_store.get(key) if _feature_store is not None else None
+            if stored is None:
+                features = extract_features(data)
+            else:
+                features = dict(zip(FEATURE_ORDER, stored.tolist()))
+        except Exception as e:
+            results[i] = {"error": str(e) or type(e).__name__}
+            continue
+        results[i] = {"key": key, "stored": stored is not None, **features}
+        valid.append(i)
+        X.append([features[f] for f in FEATURE_ORDER])
+    if valid:
+        for i, result in zip(valid, _results(*score_rows(np.array(X, dtype=float)))):
+            results[i] = {**result, **results[i]}
+    return results
+
+
+# ======================
+# Inputs
+# ======================
+def image_paths(directory):
+    """Paths of the images under directory, in sorted order"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_SUFFIXES)]
+    return paths
+
+def image_chunks(directory, chunk_size):
+    """(keys, paths) chunks of the images under directory, in sorted order"""
+    paths = image_paths(directory)
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start:start + chunk_size]
+        yield [os.path.relpath(p, directory) for p in chunk], chunk
+
+def _check_columns(columns):
+    missing = [f for f in FEATURE_ORDER if f not in columns]
+    if missing:
+        raise SystemExit(f"Input is missing columns: {', '.join(missing)}")
+
+def csv_chunks(path, chunk_size):
+    """(row numbers, float rows in FEATURE_ORDER) chunks of a CSV file with a header line"""
+    import pandas as pd
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        _check_columns([c.strip() for c in next(csv.reader(f), [])])
+    reader = pd.read_csv(path, usecols=lambda c: c.strip() in FEATURE_ORDER, chunksize=chunk_size,
+                         encoding="utf-8-sig", skip_blank_lines=True)
+    index = 0
+    for frame in reader:
+        frame.columns = [c.strip() for c in frame.columns]
+        # Values that do not parse become NaN and are reported per row
+        X = frame[FEATURE_ORDER].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        yield range(index, index + len(X)), X
+        index += len(X)
+
+def parquet_chunks(path, chunk_size):
+    """(row numbers, float rows in FEATURE_ORDER) chunks of a Parquet file"""
+    pq = _pyarrow_parquet()
+    parquet = pq.ParquetFile(path)
+    _check_columns(parquet.schema_arrow.names)
+    index = 0
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=FEATURE_ORDER):
+        X = np.column_stack([batch.column(f).to_numpy(zero_copy_only=False) for f in FEATURE_ORDER]).astype(float)
+        yield range(index, index + len(X)), X
+        index += len(X)
+
+def store_chunks(path, chunk_size):
+    """(image hashes, float rows in FEATURE_ORDER) chunks of a feature store, read from its mmap"""
+    for keys, X in _read_store(path).items(chunk_size):
+        yield keys, X.astype(float)
+
+def _read_store(path):
+    """
+    The feature store in path, opened with the extraction settings it was built
+    with: re-scoring only reads the stored vectors, whatever the current settings
+    """
+    store = FeatureStore(path)
+    if store.columns != FEATURE_ORDER:
+        raise SystemExit(f"Feature store {path} does not have the columns of FEATURE_ORDER")
+    return store
+
+def _is_feature_store(path):
+    return os.path.exists(os.path.join(path, "index.sqlite3"))
+
+def _pyarrow_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet input/output needs pyarrow (pip install pyarrow)")
+    return pq
+
+
+# ======================
+# Outputs
+# ======================
+class CsvOutput:
+    """Results appended to one CSV file; resuming cuts off anything past the checkpoint"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def open(self, position):
+        self.file = open(self.path, "a+b" if position else "wb")
+        self.file.truncate(position)
+        self.file.seek(position)
+        if not position:
+            self._write([self.columns])
+
+    def _write(self, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        self.file.write(text.getvalue().encode())
+
+    def write(self, chunk_index, records):
+        self._write([["" if r.get(c) is None else r.get(c) for c in self.columns] for r in records])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+class ParquetOutput:
+    """Results as one Parquet file per chunk in a directory; resuming drops parts past the checkpoint"""
+
+    def __init__(self, path, columns):
+        self.pq = _pyarrow_parquet()
+        self.path = path
+        self.columns = columns
+
+    def open(self, position):
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name.startswith("part-") and int(name[5:11]) >= position:
+                os.remove(os.path.join(self.path, name))
+
+    def write(self, chunk_index, records):
+        import pyarrow as pa
+        table = pa.table({c: [r.get(c) for r in records] for c in self.columns})
+        self.pq.write_table(table, os.path.join(self.path, f"part-{chunk_index:06d}.parquet"))
+        return chunk_index + 1
+
+    def close(self):
+        pass
+
+
+# ======================
+# Checkpoints
+# ======================
+def _fingerprint(path):
+    """Identifies the input of a run; a changed input cannot be resumed"""
+    if _is_feature_store(path):
+        stats = _read_store(path).stats()
+        return {"path": os.path.abspath(path), "rows": stats["rows"], "generation": stats["generation"]}
+    if os.path.isdir(path):
+        # Chunks are positions in the sorted listing, so any added, removed or changed image counts
+        listing = []
+        for image in image_paths(path):
+            image_stat = os.stat(image)
+            listing.append([os.path.relpath(image, path), image_stat.st_size, image_stat.st_mtime])
+        return {"path": os.path.abspath(path), "images": len(listing),
+                "listing": content_hash(json.dumps(listing).encode())}
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def load_checkpoint(path, run):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["run"] != run:
+        raise SystemExit(f"{path} belongs to a different input or chunk size; pass --restart to start over")
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+# ======================
+# Driver
+# ======================
+def run(args):
+    images = os.path.isdir(args.input) and not _is_feature_store(args.input)
+    if images:
+        chunks = image_chunks(args.input, args.chunk_size)
+        score, key_column = score_image_chunk, "path"
+        columns = [key_column, "key"] + RESULT_COLUMNS + FEATURE_ORDER
+    elif os.path.isdir(args.input):
+        # Re-scoring everything in a feature store: no image is decoded
+        chunks = store_chunks(args.input, args.chunk_size)
+        score, key_column = score_row_chunk, "key"
+        columns = [key_column] + RESULT_COLUMNS
+    elif args.input.lower().endswith(".parquet"):
+        chunks = parquet_chunks(args.input, args.chunk_size)
+        score, key_column = score_row_chunk, "row"
+        columns = [key_column] + RESULT_COLUMNS
+    else:
+        chunks = csv_chunks(args.input, args.chunk_size)
+        score, key_column = score_row_chunk, "row"
+        columns = [key_column] + RESULT_COLUMNS
+
+    output_class = ParquetOutput if args.output.lower().endswith(".parquet") else CsvOutput
+    output = output_class(args.output, columns)
+    checkpoint_path = args.output + ".checkpoint.json"
+    run_id = {**_fingerprint(args.input), "chunk_size": args.chunk_size, "output": os.path.abspath(args.output)}
+
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path, run_id)
+    if checkpoint is None:
+        if os.path.exists(args.output) and not args.restart:
+            raise SystemExit(f"{args.output} exists and has no checkpoint; pass --restart to overwrite it")
+        checkpoint = {"run": run_id, "chunks": 0, "rows": 0, "position": 0, "complete": False}
+    if checkpoint["complete"]:
+        print(f"{args.output} is already complete ({checkpoint['rows']} rows)")
+        return
+
+    # Chunks written before the interruption are read past, not scored again
+    for _ in range(checkpoint["chunks"]):
+        next(chunks, None)
+    if checkpoint["chunks"]:
+        print(f"resuming after {checkpoint['rows']} rows ({checkpoint['chunks']} chunks)")
+
+    output.open(checkpoint["position"])
+    store_path = args.feature_store if images else None
+    store = open_feature_store(store_path) if store_path else None
+    workers = os.cpu_count() if args.workers is None else args.workers
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(store_path,))
+    else:
+        _init_worker(store_path)
+
+    # The first Ctrl-C stops after the chunk being written, a second one right away
+    stopping = []
+
+    def request_stop(signum, frame):
+        if stopping:
+            raise KeyboardInterrupt
+        stopping.append(signum)
+        print("\nstopping after the current chunk (Ctrl-C again to abort)")
+    signal.signal(signal.SIGINT, request_stop)
+
+    start, done, errors = time.perf_counter(), 0, 0
+    # Chunks in flight: enough to keep every worker busy, few enough to bound memory
+    pending = deque()
+    try:
+        while not stopping:
+            while len(pending) < max(2 * workers, 1):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                keys, items = chunk
+                pending.append((keys, executor.submit(score, items) if executor else score(items)))
+            if not pending:
+                break
+            keys, future = pending.popleft()
+            results = future.result() if executor else future
+            records = [{key_column: key, **result} for key, result in zip(keys, results)]
+            if store is not None:
+                new = [r for r in records if r.get("stored") is False]
+                store.put_many([r["key"] for r in new], [[r[f] for f in FEATURE_ORDER] for r in new])
+            checkpoint["position"] = output.write(checkpoint["chunks"], records)
+            checkpoint["chunks"] += 1
+            checkpoint["rows"] += len(records)
+            save_checkpoint(checkpoint_path, checkpoint)
+            done += len(records)
+            errors += sum("error" in r for r in results)
+    except KeyboardInterrupt:
+        stopping.append(signal.SIGINT)
+    finally:
+        output.close()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if stopping:
+        print(f"interrupted after {checkpoint['rows']} rows; run the same command again to resume")
+        sys.exit(130)
+
+    checkpoint["complete"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    elapsed = time.perf_counter() - start
+    unit = "images" if images else "rows"
+    print(f"scored {done} {unit} in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} {unit}/s, "
+          f"{workers or 1} workers, {errors} errors) -> {args.output}")
+
+def main():
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser(prog="python score_batch.py", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("input", help="directory of images, or a .csv/.parquet file of feature rows")
+    parser.add_argument("output", help="results file (.csv) or directory of Parquet parts (.parquet)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count, 0 = in-process)")
+    parser.add_argument("--chunk-size", type=int,
+                        help="rows or images per chunk and checkpoint (default: 10000 rows, 32 images)")
+    parser.add_argument("--feature-store", metavar="DIR",
+                        help="with an image directory: reuse and add to the features stored in DIR")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and overwrite the output")
+    args = parser.parse_args()
+    if args.chunk_size is None:
+        args.chunk_size = 32 if os.path.isdir(args.input) else 10000
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
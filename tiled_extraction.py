@@ -0,0 +1,176 @@
+"""
+Band-by-band segmentation for images too large to process in one piece.
+
+The image is walked in horizontal bands of a fixed number of rows. Otsu's
+threshold comes from a histogram accumulated over the bands. Connected
+components are labeled per band and stitched across band borders, so small
+objects are removed and the largest component is found exactly as on the
+whole image. Box counts and the texture histogram are accumulated band by
+band, and the cleaned mask is kept bit-packed (1 bit per pixel) so the tumor
+can be cut out of it afterwards.
+"""
+import numpy as np
+
+from feature_kernels import box_counts, contrast_histogram, kept_objects, occupancy_pyramid
+from metrics import stage
+
+# Peak bytes per pixel of extract_features on a whole image, besides the image itself
+IN_MEMORY_BYTES_PER_PIXEL = 14
+# The same with LEAN_EXTRACTION, including its reused mask and label buffers (5 B/px)
+LEAN_BYTES_PER_PIXEL = 9
+# Peak bytes per pixel of the band being processed
+BAND_BYTES_PER_PIXEL = 22
+# Band heights are a multiple of 2**ALIGN_LEVELS, so boxes up to that size never straddle two bands
+ALIGN_LEVELS = 6
+
+
+def needs_tiling(shape, memory_budget, bytes_per_pixel=IN_MEMORY_BYTES_PER_PIXEL):
+    """True when whole-image extraction would exceed memory_budget bytes (0 disables tiling)"""
+    pixels = shape[0] * shape[1]
+    return bool(memory_budget) and pixels * (1 + bytes_per_pixel) > memory_budget
+
+def band_rows(shape, memory_budget):
+    """Rows per band so that the image, the packed mask and one band fit in memory_budget bytes"""
+    h, w = shape
+    fixed = h * w + h * ((w + 7) // 8)
+    align = 2 ** ALIGN_LEVELS
+    rows = (memory_budget - fixed) // (BAND_BYTES_PER_PIXEL * w)
+    return int(max(align, rows // align * align))
+
+def _bands(h, rows):
+    for start in range(0, h, rows):
+        yield start, min(start + rows, h)
+
+
+class _Components:
+    """
+    Connected components over all bands. Each band is labeled on its own;
+    pieces that touch across a band border are joined once every band is in.
+    Piece ids are assigned band by band in raster order, so the smallest piece
+    id of a component marks its first pixel, as in whole-image labeling.
+    """
+
+    def __init__(self, connectivity):
+        from scipy import ndimage
+        self.structure = ndimage.generate_binary_structure(2, connectivity)
+        # Column offsets between a pixel and its neighbours in the next row
+        self.shifts = (-1, 0, 1) if connectivity == 2 else (0,)
+        self.n = 0
+        self.sizes = []
+        self.edges = []
+        self._last_row = None
+
+    def label(self, binary):
+        """Label one band; returns its labels and the id of its label 1"""
+        from scipy import ndimage
+        labels, n = ndimage.label(binary, self.structure)
+        offset = self.n
+        if self._last_row is not None:
+            self._join_border(self._last_row, labels[0], offset)
+        self._last_row = np.where(labels[-1] > 0, labels[-1] + offset - 1, -1)
+        self.sizes.append(np.bincount(labels.ravel(), minlength=n + 1)[1:])
+        self.n += n
+        return labels, offset
+
+    def _join_border(self, above, below, offset):
+        w = below.size
+        for s in self.shifts:
+            a = above[max(0, -s):w - max(0, s)]
+            b = below[max(0, s):w - max(0, -s)]
+            touching = (a >= 0) & (b > 0)
+            self.edges.append(np.stack([a[touching], b[touching] + offset - 1]))
+
+    def resolve(self):
+        """Component of every piece, and component sizes and first piece ids"""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        edges = np.concatenate(self.edges, axis=1) if self.edges else np.zeros((2, 0), dtype=np.int64)
+        graph = coo_matrix((np.ones(edges.shape[1]), (edges[0], edges[1])), shape=(self.n, self.n))
+        n_components, component = connected_components(graph, directed=False)
+        sizes = np.bincount(component, weights=np.concatenate(self.sizes), minlength=n_components)
+        first = np.full(n_components, self.n)
+        np.minimum.at(first, component, np.arange(self.n))
+        return component, sizes, first
+
+
+class TiledSegmentation:
+    """
+    Small-object removal, labeling, box counting and the whole-image texture
+    histogram of img > thresh, one band of `rows` rows at a time.
+
+    box: bounding-box slices of the largest 8-connected component (None if none)
+    counts: box counts for sizes 2 .. 2**n_levels of the cleaned mask
+    texture_hist: contrast_histogram of the whole image (when texture_levels is given)
+    """
+
+    def __init__(self, img, thresh, rows, min_size, n_levels, texture_levels=None, timings=None):
+        h, w = img.shape
+        self.width = w
+        bands = list(_bands(h, rows))
+
+        # remove_small_objects sees 4-connected objects
+        with stage(timings, "remove_small_objects"):
+            objects = _Components(connectivity=1)
+            for start, stop in bands:
+                objects.label(img[start:stop] > thresh)
+            component, sizes, _ = objects.resolve()
+            keep = np.concatenate([[False], kept_objects(sizes[component], min_size)])
+
+        self.packed = np.empty((h, (w + 7) // 8), dtype=np.uint8)
+        regions = _Components(connectivity=2)
+        # Per 8-connected piece: first row, last row + 1, first column, last column + 1
+        piece_boxes = []
+        aligned = min(ALIGN_LEVELS, max(n_levels, 0))
+        counts = np.zeros(aligned, dtype=np.int64)
+        coarse = []
+        self.texture_hist = np.zeros(texture_levels, dtype=np.int64) if texture_levels else None
+
+        relabel = _Components(connectivity=1)
+        for start, stop in bands:
+            band = img[start:stop]
+            with stage(timings, "remove_small_objects"):
+                # Same labels and ids as the first pass
+                labels, offset = relabel.label(band > thresh)
+                lookup = np.concatenate([[False], keep[offset + 1:offset + 1 + relabel.sizes[-1].size]])
+                cleaned = lookup[labels]
+                self.packed[start:stop] = np.packbits(cleaned, axis=1)
+
+            with stage(timings, "label_regionprops"):
+                from scipy import ndimage
+                labels, _ = regions.label(cleaned)
+                for sl in ndimage.find_objects(labels):
+                    piece_boxes.append((sl[0].start + start, sl[0].stop + start, sl[1].start, sl[1].stop))
+
+            with stage(timings, "fractal_dimension"):
+                band_counts, top = occupancy_pyramid(cleaned, aligned)
+                # as an array: with no aligned levels (short side under 4 px) band_counts is []
+                counts += np.asarray(band_counts, dtype=np.int64)
+                coarse.append(top)
+
+            if self.texture_hist is not None:
+                with stage(timings, "graycomatrix"):
+                    self.texture_hist += contrast_histogram(band, texture_levels)
+
+        with stage(timings, "fractal_dimension"):
+            # Larger boxes span several bands: continue the pyramid on the stacked top levels
+            self.counts = list(counts) + box_counts(np.vstack(coarse), n_levels - aligned)
+
+        with stage(timings, "label_regionprops"):
+            self.box = self._largest_box(regions, np.array(piece_boxes).reshape(-1, 4))
+
+    @staticmethod
+    def _largest_box(regions, piece_boxes):
+        if regions.n == 0:
+            return None
+        component, sizes, first = regions.resolve()
+        # Largest component; ties go to the one that starts first in raster order
+        largest = np.flatnonzero(sizes == sizes.max())
+        winner = largest[np.argmin(first[largest])]
+        boxes = piece_boxes[component == winner]
+        return (slice(boxes[:, 0].min(), boxes[:, 1].max()), slice(boxes[:, 2].min(), boxes[:, 3].max()))
+
+    def mask(self, box):
+        """The cleaned binary mask inside box"""
+        rows, cols = box
+        bits = np.unpackbits(self.packed[rows], axis=1, count=self.width)
+        return bits[:, cols].view(bool)